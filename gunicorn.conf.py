@@ -0,0 +1,10 @@
+# Read by gunicorn from the working directory; see SERVER_MODE in settings.
+from decouple import config
+
+if config('SERVER_MODE', default='wsgi') == 'asgi':
+    wsgi_app = 'notes_project.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'notes_project.wsgi:application'
+
+workers = config('WEB_CONCURRENCY', default=2, cast=int)
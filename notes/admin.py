@@ -1,8 +1,39 @@
-from django.contrib import admin
-from .models import Note
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.template.defaultfilters import pluralize
+from . import jobs
+from .models import Job, Note
 
 
 @admin.register(Note)
 class NoteAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'archived', 'updated_at')
-    list_filter = ('archived', 'trashed')
\ No newline at end of file
+    list_filter = ('archived', 'trashed')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_by', 'locked_at', 'result', 'error', 'created_at', 'updated_at')
+
+
+@admin.action(description='Delete selected users in the background')
+def delete_in_background(modeladmin, request, queryset):
+    # Deleting a user cascades to all of their notes; do it off-request.
+    count = 0
+    for user_id in queryset.values_list('pk', flat=True):
+        jobs.enqueue('delete_user', user=request.user, user_id=user_id)
+        count += 1
+    modeladmin.message_user(
+        request, f'Queued deletion of {count} user{pluralize(count)}.', messages.SUCCESS,
+    )
+
+
+class NotesUserAdmin(UserAdmin):
+    actions = [delete_in_background]
+
+
+admin.site.unregister(User)
+admin.site.register(User, NotesUserAdmin)
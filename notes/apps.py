@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class NotesConfig(AppConfig):
     name = 'notes'
+
+    def ready(self):
+        from . import avatars, compression, instrumentation, search, tasks  # noqa: F401 (registers the jobs)
+
+        avatars.preload()
+        pre_migrate.connect(search.drop_view, sender=self)
+        post_migrate.connect(search.ensure_schema, sender=self)
+        connection_created.connect(instrumentation.install_query_timer)
+        connection_created.connect(compression.register_functions)
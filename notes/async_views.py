@@ -0,0 +1,122 @@
+"""Async versions of the read-heavy views, used when serving over ASGI.
+
+They do their queries through the async ORM so a worker's event loop keeps
+serving other requests while one waits on the database. Writes still go
+through the sync views in views.py; a POST to an async view is handed to
+its sync counterpart in a thread.
+
+Templates must not touch the database from the event loop, so the user and
+avatar are resolved up front instead of lazily by the context processors.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseBadRequest
+from django.shortcuts import render
+
+from . import listcache, views
+from .conditional import (
+    aactive_etag, aarchive_etag, aconditional_page, anote_etag,
+    anote_last_modified, atrash_etag,
+)
+from .models import LISTING_FIELDS, Note, acached_avatar
+from .pagination import PAGE_SIZE, CursorPage, InvalidCursor, apaginate
+from .routers import read_from_replica
+from .search import search_notes
+
+
+def login_required(view):
+    """Async @login_required that also swaps the lazy ``request.user`` for
+    the loaded user, so nothing reads it synchronously later."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _page_context(request, context=None):
+    return {
+        **(context or {}),
+        'profile': {'avatar': await acached_avatar(request.user.pk)},
+    }
+
+
+async def _render_listing(request, notes, template, fragment, context=None):
+    """Async version of views._render_listing()."""
+    cursor = request.GET.get('cursor')
+    key = await listcache.afragment_key(
+        request.user.pk, request.resolver_match.url_name, cursor,
+    )
+    cards = await listcache.aget_fragment(key)
+    if cards is None:
+        try:
+            page = await apaginate(notes, cursor)
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid cursor.')
+        cards = views._render_cards(page, fragment)
+        await listcache.aset_fragment(key, cards)
+    context = await _page_context(request, context)
+    return views._render_page(request, cards, template, context)
+
+
+@login_required
+@read_from_replica
+@aconditional_page(aactive_etag)
+async def notes_list(request):
+    if request.method == 'POST':
+        return await sync_to_async(views.notes_list)(request)
+
+    notes = Note.objects.active(request.user).only(*LISTING_FIELDS)
+
+    context = {'bulk_actions': [('archive', 'Archive'), ('trash', 'Delete')]}
+    q = request.GET.get('q', '').strip()
+    if q:
+        # Ranked results have no stable keyset; show the best page of them.
+        page = CursorPage([note async for note in search_notes(notes, q)[:PAGE_SIZE]])
+        cards = views._render_cards(page, 'notes/_note_cards.html')
+        context = await _page_context(request, {**context, 'query': q})
+        return views._render_page(request, cards, 'notes/list.html', context)
+
+    return await _render_listing(
+        request, notes, 'notes/list.html', 'notes/_note_cards.html', context,
+    )
+
+
+@login_required
+@aconditional_page(anote_etag, anote_last_modified)
+async def edit_note(request, note_id):
+    if request.method == 'POST':
+        return await sync_to_async(views.edit_note)(request, note_id)
+
+    note = await Note.objects.filter(id=note_id, user=request.user).afirst()
+    if note is None:
+        raise Http404('No Note matches the given query.')
+    context = await _page_context(request, {'note': note})
+    return render(request, 'notes/edit.html', context)
+
+
+@login_required
+@read_from_replica
+@aconditional_page(aarchive_etag)
+async def archive_notes(request):
+    notes = Note.objects.archived(request.user).only(*LISTING_FIELDS)
+    return await _render_listing(request, notes, 'notes/list.html', 'notes/_note_cards.html', {
+        'bulk_actions': [('unarchive', 'Unarchive'), ('trash', 'Delete')],
+    })
+
+
+@login_required
+@read_from_replica
+@aconditional_page(atrash_etag)
+async def trash_notes(request):
+    notes = Note.objects.in_trash(request.user).only(*LISTING_FIELDS)
+    return await _render_listing(request, notes, 'notes/trash.html', 'notes/_trash_cards.html', {
+        'bulk_actions': [('restore', 'Restore'), ('delete', 'Delete forever')],
+        'retention_days': settings.TRASH_RETENTION_DAYS,
+    })
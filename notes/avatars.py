@@ -0,0 +1,119 @@
+"""Content-addressed avatar storage.
+
+Every avatar is stored once, as ``avatars/<sha256 of its bytes><ext>``;
+users with the same picture (most of them have one of the 26 letter
+avatars) share one file. Because a name always maps to the same bytes,
+media.py can cache these files as immutable.
+
+Shared files must not be deleted along with one profile; ``manage.py
+dedupe_avatars`` deletes the ones no profile uses any more.
+"""
+import hashlib
+import os
+import re
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+AVATAR_DIR = 'avatars'
+LETTER_AVATAR_DIR = os.path.join('static', 'avatars')
+
+_CONTENT_NAME_RE = re.compile(rf'^{AVATAR_DIR}/[0-9a-f]{{64}}\.\w+$')
+
+# Letter -> SVG bytes, filled by preload() when the app starts.
+LETTER_AVATARS = {}
+# Names of letter avatars known to be in storage, so signups skip the check.
+_stored_letters = {}
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Names each saved file after the SHA-256 of its content and saves
+    content that is already stored by returning the existing name."""
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        ext = os.path.splitext(name)[1].lower()
+        name = f'{AVATAR_DIR}/{digest.hexdigest()}{ext}'
+        if self.exists(name):
+            # Fresh again, so dedupe_avatars leaves it to the profile that
+            # is about to use it.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def save_derived(self, name, content):
+        """Save a file derived from a stored one under `name` as given;
+        since its source is content-addressed, so is the derived file."""
+        if not self.exists(name):
+            super().save(name, content)
+        return name
+
+
+avatar_storage = ContentAddressedStorage()
+
+
+def get_avatar_storage():
+    return avatar_storage
+
+
+class Avatar(NamedTuple):
+    """A stored avatar; resized variants exist once `has_thumbnails`."""
+
+    name: str
+    has_thumbnails: bool = False
+
+    @property
+    def url(self):
+        return avatar_storage.url(self.name)
+
+    def variant_url(self, size, ext):
+        return avatar_storage.url(variant_name(self.name, size, ext))
+
+
+def variant_name(name, size, ext):
+    """Name of the `size` px `ext` rendition of the avatar stored as `name`."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{AVATAR_DIR}/{size}/{stem}.{ext}'
+
+
+def is_content_name(name):
+    return bool(_CONTENT_NAME_RE.match(name or ''))
+
+
+def preload():
+    """Read the letter avatars into memory; called from NotesConfig.ready."""
+    directory = os.path.join(settings.BASE_DIR, LETTER_AVATAR_DIR)
+    LETTER_AVATARS.clear()
+    _stored_letters.clear()
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        letter, ext = os.path.splitext(filename)
+        if ext == '.svg' and len(letter) == 1:
+            with open(os.path.join(directory, filename), 'rb') as f:
+                LETTER_AVATARS[letter.upper()] = f.read()
+
+
+def letter_avatar(initial):
+    """Return the stored name of the avatar for `initial`, or None."""
+    initial = initial[:1].upper()
+    if initial not in _stored_letters:
+        data = LETTER_AVATARS.get(initial)
+        if data is None:
+            return None
+        _stored_letters[initial] = avatar_storage.save(f'{initial}.svg', ContentFile(data))
+    return _stored_letters[initial]
+
+
+@receiver(setting_changed)
+def _forget_stored_letters(setting, **kwargs):
+    if setting == 'MEDIA_ROOT':
+        _stored_letters.clear()
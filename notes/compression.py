@@ -0,0 +1,79 @@
+"""zlib compression of large text values, for note bodies and revisions.
+
+CompressedTextField is a TextField that, on SQLite, stores values of at
+least NOTE_COMPRESS_MIN_LENGTH characters as a zlib BLOB in the same
+column; SQLite keeps a BLOB as-is in a TEXT column. Values read back
+stay compressed until the attribute is first read on the instance, so
+loading a note does not inflate a body nothing looks at. values() and
+values_list() return compressed values as Packed bytes; pass them through
+text().
+
+PostgreSQL already compresses large values itself (TOAST), and its
+column is typed text, so there the field is a plain TextField.
+
+SQL that reads the column on SQLite, such as the search triggers, wraps
+it in notes_text(), a function registered on every connection.
+"""
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+LEVEL = 6
+
+
+class Packed(bytes):
+    """A compressed value as read from the database."""
+
+
+def pack(value):
+    """`value` compressed, or unchanged if compressing would not save space."""
+    if len(value) < settings.NOTE_COMPRESS_MIN_LENGTH:
+        return value
+    raw = value.encode()
+    packed = zlib.compress(raw, LEVEL)
+    return Packed(packed) if len(packed) < len(raw) else value
+
+
+def text(value):
+    """The text held by a column value, compressed or not."""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    # A data descriptor, so the value in instance.__dict__ does not hide it.
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, Packed):
+            value = instance.__dict__[self.field.attname] = text(value)
+        return value
+
+
+class CompressedTextField(models.TextField):
+    descriptor_class = CompressedTextDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        return Packed(value) if isinstance(value, bytes) else value
+
+    def get_prep_value(self, value):
+        if isinstance(value, bytes):
+            return value
+        return super().get_prep_value(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if isinstance(value, str) and connection.vendor == 'sqlite':
+            return pack(value)
+        return value
+
+
+def register_functions(sender, connection, **kwargs):
+    """connection_created receiver adding notes_text() to SQLite."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('notes_text', 1, text, deterministic=True)
@@ -0,0 +1,170 @@
+"""Validators for conditional GETs of note pages.
+
+A listing's ETag hashes the max ``updated_at`` and row count of the notes it
+shows. Every state change that adds a note to a listing stamps it with a new
+``updated_at`` and every change that removes one lowers the count, so the pair
+moves whenever the listing does. Both come from one index-only aggregate.
+
+The hash also covers what base.html shows around the notes (name, avatar)
+and the CSRF secret the page's forms were rendered against, so a 304 never
+hands back a page with stale chrome or dead forms. Listings get no
+Last-Modified: a delete does not move the max ``updated_at``.
+
+Django's @condition calls its validators synchronously even around a
+coroutine view, so async views use aconditional_page() and the ``a``-prefixed
+validators, which run the same queries through the async ORM.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import Note, acached_avatar, cached_avatar
+
+
+def conditional_page(etag_func, last_modified_func=None):
+    """Like @condition, but only for GET/HEAD and with a private
+    ``no-cache`` policy so browsers revalidate instead of guessing."""
+    def decorator(view):
+        conditional_view = condition(etag_func, last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def aconditional_page(etag_func, last_modified_func=None):
+    """conditional_page() for async views, taking coroutine validators."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            last_modified = None
+            if last_modified_func:
+                dt = await last_modified_func(request, *args, **kwargs)
+                if dt:
+                    last_modified = timegm(dt.utctimetuple())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified,
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag and not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(request, *parts):
+    return _hash_etag(request, cached_avatar(request.user.pk), parts)
+
+
+async def _aetag(request, *parts):
+    return _hash_etag(request, await acached_avatar(request.user.pk), parts)
+
+
+def _hash_etag(request, avatar, parts):
+    # Pending flash messages are rendered once; never answer 304 over them.
+    if len(get_messages(request)):
+        return None
+    # Settle the CSRF secret the page's forms will be rendered with.
+    get_token(request)
+    user = request.user
+    key = '|'.join(str(part) for part in (
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        user.pk,
+        user.get_full_name(),
+        avatar,
+        request.META['CSRF_COOKIE'],
+        *parts,
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _listing_etag(request, notes):
+    stats = notes.aggregate(latest=Max('updated_at'), count=Count('id'))
+    return _etag(request, stats['latest'], stats['count'])
+
+
+async def _alisting_etag(request, notes):
+    stats = await notes.aaggregate(latest=Max('updated_at'), count=Count('id'))
+    return await _aetag(request, stats['latest'], stats['count'])
+
+
+def active_etag(request):
+    return _listing_etag(request, Note.objects.active(request.user))
+
+
+def archive_etag(request):
+    return _listing_etag(request, Note.objects.archived(request.user))
+
+
+def trash_etag(request):
+    return _listing_etag(request, Note.objects.in_trash(request.user))
+
+
+async def aactive_etag(request):
+    return await _alisting_etag(request, Note.objects.active(request.user))
+
+
+async def aarchive_etag(request):
+    return await _alisting_etag(request, Note.objects.archived(request.user))
+
+
+async def atrash_etag(request):
+    return await _alisting_etag(request, Note.objects.in_trash(request.user))
+
+
+def _note_updated_at(request, note_id):
+    # Shared by the ETag and Last-Modified functions of one request.
+    if not hasattr(request, '_note_updated_at'):
+        request._note_updated_at = Note.objects.filter(
+            id=note_id, user=request.user,
+        ).values_list('updated_at', flat=True).first()
+    return request._note_updated_at
+
+
+def note_etag(request, note_id):
+    updated_at = _note_updated_at(request, note_id)
+    return _etag(request, updated_at) if updated_at else None
+
+
+def note_last_modified(request, note_id):
+    return _note_updated_at(request, note_id)
+
+
+async def _anote_updated_at(request, note_id):
+    if not hasattr(request, '_note_updated_at'):
+        request._note_updated_at = await Note.objects.filter(
+            id=note_id, user=request.user,
+        ).values_list('updated_at', flat=True).afirst()
+    return request._note_updated_at
+
+
+async def anote_etag(request, note_id):
+    updated_at = await _anote_updated_at(request, note_id)
+    return await _aetag(request, updated_at) if updated_at else None
+
+
+async def anote_last_modified(request, note_id):
+    return await _anote_updated_at(request, note_id)
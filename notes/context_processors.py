@@ -1,12 +1,24 @@
-from .models import Profile
+from django.utils.functional import SimpleLazyObject
+
+from .models import cached_avatar
+
+
+class ProfileSummary:
+    """The part of the profile base.html shows on every page."""
+
+    def __init__(self, user):
+        self.avatar = cached_avatar(user.pk)
 
 
 def profile(request):
     """Add `profile` to template context when user is authenticated.
 
-    Ensures a Profile exists and returns it; returns None for anonymous users.
+    The profile is looked up only if a template actually reads it, and the
+    avatar comes from the cache after the first lookup, so redirects and
+    pages that do not show it cost no queries. Returns {} for anonymous
+    users.
     """
-    if not request.user or not request.user.is_authenticated:
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
         return {}
-    profile_obj, _ = Profile.objects.get_or_create(user=request.user)
-    return {"profile": profile_obj}
+    return {"profile": SimpleLazyObject(lambda: ProfileSummary(user))}
@@ -26,4 +26,10 @@ class ProfileForm(forms.ModelForm):
         # Pre-fill name fields from User model
         if self.instance and self.instance.user:
             self.fields['first_name'].initial = self.instance.user.first_name
-            self.fields['last_name'].initial = self.instance.user.last_name
\ No newline at end of file
+            self.fields['last_name'].initial = self.instance.user.last_name
+
+    def save(self, commit=True):
+        if 'profile_picture' in self.changed_data:
+            # The renditions of the old picture no longer apply.
+            self.instance.has_thumbnails = False
+        return super().save(commit)
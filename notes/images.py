@@ -0,0 +1,76 @@
+"""Resized renditions of uploaded avatars.
+
+An upload is stored as is; a background job (see jobs.py) then builds
+square EXIF-free WebP and JPEG copies of it in AVATAR_SIZES and
+flags the profile, from which point templates use the smallest copy that
+fits (see the ``avatar_img`` tag) instead of the original.
+"""
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .avatars import avatar_storage, variant_name
+from .jobs import enqueue
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (48, 96, 128, 256)
+
+# Extension -> Pillow format and save options. JPEG is the fallback for
+# browsers without WebP.
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_size(pixels):
+    """The smallest rendition at least `pixels` wide, else the largest."""
+    return next((size for size in AVATAR_SIZES if size >= pixels), AVATAR_SIZES[-1])
+
+
+def schedule_thumbnails(profile):
+    """Queue a job building the renditions of `profile`'s picture."""
+    name = profile.profile_picture.name
+    if not name or name.endswith('.svg'):
+        return
+    enqueue('make_thumbnails', user=profile.user, profile_id=profile.pk, name=name)
+
+
+def make_thumbnails(profile_id, name):
+    """Write every rendition of avatar `name`, then flag the profile if it
+    still uses that picture. Returns False if the file is not an image."""
+    try:
+        with avatar_storage.open(name) as f:
+            image = Image.open(f)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('Cannot make thumbnails of %s', name, exc_info=True)
+        return False
+
+    image = ImageOps.exif_transpose(image)
+    image.info.clear()  # no EXIF (location, camera) in what gets served
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    for size in AVATAR_SIZES:
+        thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            out = BytesIO()
+            (_flatten(thumb) if fmt == 'JPEG' else thumb).save(out, fmt, **options)
+            avatar_storage.save_derived(variant_name(name, size, ext), ContentFile(out.getvalue()))
+
+    profile = Profile.objects.filter(pk=profile_id, profile_picture=name).first()
+    if profile:
+        profile.has_thumbnails = True
+        profile.save(update_fields=['has_thumbnails'])
+    return True
+
+
+def _flatten(image):
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
@@ -0,0 +1,210 @@
+"""Per-request timing: SQL, template rendering and context processors.
+
+ServerTimingMiddleware starts a RequestTiming for each request and keeps it
+in a context variable, which asgiref carries into sync_to_async threads, so
+async views are measured too. Three hooks add to it:
+
+- every database connection gets an execute wrapper (see ready());
+- the DjangoTemplates backend below times each top-level render;
+- that backend also wraps the engine's context processors.
+
+Each figure excludes the ones nested inside it: queries run while a
+template renders count as SQL, not template time. Outside a request the
+hooks only check the context variable, so they cost next to nothing.
+
+The totals go out in a ``Server-Timing`` header, only to staff and
+METRICS_TOKEN holders, as with /metrics/. Requests slower than
+SLOW_REQUEST_MS, or that run one statement REPEATED_QUERY_THRESHOLD times
+or more (the usual sign of an N+1 loop), are logged as JSON with their
+slowest queries, whoever made them.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+SQL_LOG_LENGTH = 500
+
+_current = ContextVar('request_timing', default=None)
+
+
+def may_read_metrics(request, user):
+    """Whether `request`, made by `user` (or None), may see server
+    metrics: staff, or ``Authorization: Bearer <METRICS_TOKEN>`` when that
+    setting is configured."""
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get('Authorization', '')
+    return bool(user is not None and user.is_staff) or bool(
+        token and constant_time_compare(auth, f'Bearer {token}')
+    )
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []  # (sql, seconds)
+        self.sql = 0.0
+        self.template = 0.0
+        self.context = 0.0
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def repeated(self, threshold):
+        """Statements run at least `threshold` times, most frequent first."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+    def slowest(self, n):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:n]
+
+    def header(self, total):
+        return ', '.join((
+            f'db;dur={self.sql * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            f'ctx;dur={self.context * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that adds the statement to the current
+    request's timing."""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        timing.sql += elapsed
+        timing.queries.append((sql, elapsed))
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        sql, processors = timing.sql, timing.context
+        try:
+            return super().render(context, request)
+        finally:
+            nested = (timing.sql - sql) + (timing.context - processors)
+            timing.template += time.perf_counter() - start - nested
+
+
+def _timed_processor(processor):
+    def timed(request):
+        timing = _current.get()
+        if timing is None:
+            return processor(request)
+        start = time.perf_counter()
+        sql = timing.sql
+        try:
+            return processor(request)
+        finally:
+            timing.context += time.perf_counter() - start - (timing.sql - sql)
+    return timed
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock backend, with rendering and context processors timed."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.engine.template_context_processors = tuple(
+            _timed_processor(processor)
+            for processor in self.engine.template_context_processors
+        )
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.SERVER_TIMING:
+            return self.get_response(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        if not settings.SERVER_TIMING:
+            return await self.get_response(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        auser = getattr(request, 'auser', None)
+        return self.finish(request, response, timing, await auser() if auser else None)
+
+    def finish(self, request, response, timing, user):
+        total = timing.total
+        if may_read_metrics(request, user):
+            response['Server-Timing'] = timing.header(total)
+        repeated = timing.repeated(settings.REPEATED_QUERY_THRESHOLD)
+        if total * 1000 >= settings.SLOW_REQUEST_MS or repeated:
+            log_request(request, response, timing, total, repeated)
+        return response
+
+
+def log_request(request, response, timing, total, repeated):
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 1),
+        'sql_ms': round(timing.sql * 1000, 1),
+        'template_ms': round(timing.template * 1000, 1),
+        'context_ms': round(timing.context * 1000, 1),
+        'queries': len(timing.queries),
+        'slowest': [
+            {'sql': sql[:SQL_LOG_LENGTH], 'ms': round(seconds * 1000, 2)}
+            for sql, seconds in timing.slowest(settings.SLOW_REQUEST_TOP_QUERIES)
+        ],
+        'repeated': [
+            {'sql': sql[:SQL_LOG_LENGTH], 'count': count} for sql, count in repeated
+        ],
+    }
+    logger.warning(
+        '%s %s', 'Repeated queries' if repeated else 'Slow request', json.dumps(record),
+        extra={'request_timing': record},
+    )
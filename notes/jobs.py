@@ -0,0 +1,208 @@
+"""A small job queue kept in the database; no broker needed.
+
+enqueue() stores a Job row and, once the calling transaction commits,
+dispatches it according to JOBS_MODE:
+
+- ``thread`` (default): run it in this process's pool of JOBS_THREADS
+  threads. The pool lives in memory, so each web process also sweeps the
+  table every JOBS_SWEEP_SECONDS (and once at start()) for jobs a
+  restarted process left behind: due QUEUED ones, and RUNNING ones whose
+  runner died;
+- ``worker``: leave it for ``manage.py run_jobs``;
+- ``eager``: run it at once in the committing thread (tests, debugging).
+
+Any number of run_jobs processes can share the table: a job is claimed
+with a conditional UPDATE, so exactly one runner gets it. A failing job is
+retried with exponential backoff until it has been tried JOB_MAX_ATTEMPTS
+times, and a job left running by a runner that died is requeued after
+JOB_TIMEOUT seconds. Job functions are registered with @register (see
+tasks.py) and take and return JSON-serializable values.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+RETRY_DELAY = 5  # seconds before the first retry; doubles on each one
+
+_pool = None
+_sweeper = None
+_pool_lock = threading.Lock()
+
+
+def register(name):
+    """Make the decorated function runnable as job `name`."""
+    def decorator(func):
+        REGISTRY[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, /, user=None, **kwargs):
+    """Queue job `name` to be called with `kwargs`; `user` may poll it."""
+    if name not in REGISTRY:
+        raise ValueError(f'Unknown job {name!r}.')
+    job = Job.objects.create(name=name, user=user, kwargs=kwargs)
+    if settings.JOBS_MODE != 'worker':
+        transaction.on_commit(partial(_dispatch, job.pk))
+    return job
+
+
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def claim(job_id=None, worker=''):
+    """Mark a due job (job `job_id`, or else the oldest) as running and
+    return it, or None if there is none to take."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+    due = due.filter(pk=job_id) if job_id else due.order_by('run_after', 'id')
+    for pk in due.values_list('pk', flat=True)[:10]:
+        taken = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if taken:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job_id=None, worker=''):
+    """Claim and run one job; returns it, or None if there was none."""
+    job = claim(job_id, worker)
+    if job is None:
+        return None
+    try:
+        func = REGISTRY.get(job.name)
+        if func is None:
+            raise LookupError(f'No job function registered as {job.name!r}.')
+        result = func(**job.kwargs)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.error = traceback.format_exc()
+        if job.attempts < settings.JOB_MAX_ATTEMPTS:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            if settings.JOBS_MODE == 'thread':
+                _retry_later(job.pk, delay)
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.result = result
+        job.error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=[
+        'status', 'result', 'error', 'run_after', 'locked_by', 'locked_at', 'updated_at',
+    ])
+    return job
+
+
+def requeue_stale():
+    """Requeue jobs whose runner has held them for over JOB_TIMEOUT."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', locked_at=None,
+    )
+
+
+def start():
+    """Start this process's job threads and sweeper; a no-op unless
+    JOBS_MODE is 'thread'. Called when a web process starts."""
+    global _sweeper
+    if settings.JOBS_MODE != 'thread':
+        return
+    _executor()
+    with _pool_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name='jobs-sweeper', daemon=True)
+            _sweeper.start()
+
+
+def sweep():
+    """Requeue stale jobs and hand due ones to the pool; returns how many
+    were due. Other processes may claim them first, which is harmless."""
+    requeue_stale()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=timezone.now()).count()
+    pool = _executor()
+    for _ in range(min(due, settings.JOBS_THREADS)):
+        pool.submit(_drain)
+    return due
+
+
+def _sweep_forever():
+    while True:
+        close_old_connections()
+        try:
+            sweep()
+        except Exception:
+            logger.exception('Job sweep failed')
+        finally:
+            connections.close_all()
+        time.sleep(settings.JOBS_SWEEP_SECONDS)
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.JOBS_THREADS, thread_name_prefix='jobs',
+            )
+    return _pool
+
+
+def _dispatch(job_id):
+    if settings.JOBS_MODE == 'eager':
+        run_job(job_id, worker_name(':eager'))
+        return
+    start()
+    _executor().submit(_run_in_thread, job_id)
+
+
+def _retry_later(job_id, delay):
+    timer = threading.Timer(delay, _dispatch, [job_id])
+    timer.daemon = True
+    timer.start()
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id, worker_name(f':{threading.current_thread().name}'))
+    except Exception:
+        logger.exception('Could not run job %s', job_id)
+    finally:
+        connections.close_all()
+
+
+def _drain():
+    close_old_connections()
+    try:
+        while run_job(worker=worker_name(f':{threading.current_thread().name}')):
+            pass
+    except Exception:
+        logger.exception('Could not run queued jobs')
+    finally:
+        connections.close_all()
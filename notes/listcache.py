@@ -0,0 +1,109 @@
+"""Per-user cache of rendered note-list fragments.
+
+Fragments are keyed by a per-user generation that every mutating view
+bumps, so a change makes all of the user's cached pages unreachable at once
+instead of having to find and delete them.
+
+The generation is a ``time.time_ns()`` stamp written with ``set`` rather
+than a counter bumped with ``incr``: the file-based backend's ``incr`` is a
+non-atomic read/write, and an evicted counter restarting from 1 could
+revive old keys. A fresh timestamp can never collide with an earlier one.
+
+The ``a``-prefixed functions are the same operations for async views.
+"""
+import time
+
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 60 * 60
+
+_GENERATION_KEY = 'notes:gen:{user_id}'
+_FRAGMENT_KEY = 'notes:list:{user_id}:{generation}:{view}:{cursor}'
+_STAT_KEY = 'notes:stats:{name}'
+STATS = ('hits', 'misses')
+
+
+def generation(user_id):
+    key = _GENERATION_KEY.format(user_id=user_id)
+    value = cache.get(key)
+    if value is None:
+        value = time.time_ns()
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+async def ageneration(user_id):
+    key = _GENERATION_KEY.format(user_id=user_id)
+    value = await cache.aget(key)
+    if value is None:
+        value = time.time_ns()
+        if not await cache.aadd(key, value, None):
+            value = await cache.aget(key, value)
+    return value
+
+
+def bump_generation(user_id):
+    """Invalidate every cached list fragment of `user_id`."""
+    cache.set(_GENERATION_KEY.format(user_id=user_id), time.time_ns(), None)
+
+
+def fragment_key(user_id, view, cursor=None):
+    return _FRAGMENT_KEY.format(
+        user_id=user_id,
+        generation=generation(user_id),
+        view=view,
+        cursor=cursor or '',
+    )
+
+
+async def afragment_key(user_id, view, cursor=None):
+    return _FRAGMENT_KEY.format(
+        user_id=user_id,
+        generation=await ageneration(user_id),
+        view=view,
+        cursor=cursor or '',
+    )
+
+
+def get_fragment(key):
+    fragment = cache.get(key)
+    _count('misses' if fragment is None else 'hits')
+    return fragment
+
+
+async def aget_fragment(key):
+    fragment = await cache.aget(key)
+    await _acount('misses' if fragment is None else 'hits')
+    return fragment
+
+
+def set_fragment(key, fragment):
+    cache.set(key, fragment, FRAGMENT_TIMEOUT)
+
+
+async def aset_fragment(key, fragment):
+    await cache.aset(key, fragment, FRAGMENT_TIMEOUT)
+
+
+def _count(name):
+    key = _STAT_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+async def _acount(name):
+    key = _STAT_KEY.format(name=name)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+def stats():
+    values = cache.get_many([_STAT_KEY.format(name=name) for name in STATS])
+    return {name: values.get(_STAT_KEY.format(name=name), 0) for name in STATS}
@@ -0,0 +1,250 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+from django.test.client import encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from notes import revisions
+from notes.models import ChangeCounter, Job, Note
+from notes.urls import urlpatterns
+from notes.management.commands.seed_notes import DEFAULT_PASSWORD
+
+
+class Scenario:
+    """One request to benchmark.
+
+    `writes` requests run in a transaction that is rolled back, so every
+    iteration sees the same data (and commit cost is not measured).
+    """
+
+    def __init__(self, name, url, method='get', data=None, headers=None,
+                 anonymous=False, writes=False, relogin=False, content_type=None):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.data = data
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.anonymous = anonymous
+        self.writes = writes
+        self.relogin = relogin
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every page in notes/urls.py through the test client and '
+        'report latency percentiles, queries and bytes per request. Seed '
+        'data first with seed_notes. Compare against a baseline to catch '
+        'regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as (default: first bench-* user).')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD,
+                            help='Password of --user, for the login POST.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', action='append', help='Only run scenarios with this name.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every request.')
+        parser.add_argument('--json', dest='json_path', help='Write results as JSON here.')
+        parser.add_argument('--baseline', help='Compare against this JSON results file.')
+        parser.add_argument('--save-baseline', help='Write results to this baseline file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative latency/bytes increase over the baseline.')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        job = Job.objects.create(name='empty_trash', user=user, kwargs={'user_id': user.pk})
+        note = Note.objects.active(user).first()
+        revision = revisions.record(note) if note else None
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                METRICS_TOKEN='bench',
+                JOBS_MODE='worker',
+            ):
+                results = self.run_all(user, job, revision, options)
+        finally:
+            job.delete()
+            if revision:
+                revision.delete()
+
+        self.report(results)
+        for path in filter(None, (options['json_path'], options['save_baseline'])):
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run_all(self, user, job, revision, options):
+        scenarios = self.scenarios(user, job, revision, options['password'])
+        self.warn_uncovered(scenarios)
+        if options['only']:
+            scenarios = [s for s in scenarios if s.name in options['only']]
+        client = Client()
+        client.force_login(user)
+        anonymous = Client()
+        return {
+            scenario.name: self.run(
+                scenario, anonymous if scenario.anonymous else client, user, options,
+            )
+            for scenario in scenarios
+        }
+
+    def get_user(self, username):
+        users = User.objects.order_by('id')
+        user = users.filter(username=username).first() if username else \
+            users.filter(username__startswith='bench-').first()
+        if user is None:
+            raise CommandError('No user to browse as; run seed_notes or pass --user.')
+        return user
+
+    def note_ids(self, user, **flags):
+        return list(Note.objects.filter(user=user, **flags).values_list('id', flat=True)[:10])
+
+    def scenarios(self, user, job, revision, password):
+        active = self.note_ids(user, archived=False, trashed=False)
+        archived = self.note_ids(user, archived=True, trashed=False)
+        trashed = self.note_ids(user, trashed=True)
+        if not (active and archived and trashed):
+            raise CommandError(f'{user} needs active, archived and trashed notes.')
+        note = Note.objects.get(pk=active[0])
+        head = ChangeCounter.objects.filter(user=user).values_list('value', flat=True).first() or 0
+        word = note.title.split()[0]
+        cursor_page = Client()
+        cursor_page.force_login(user)
+        next_url = cursor_page.get(reverse('notes'), {'partial': 1}).get('X-Next-Cursor', '')
+        return [
+            Scenario('notes', reverse('notes')),
+            Scenario('notes:page2', reverse('notes') + next_url),
+            Scenario('notes:partial', reverse('notes') + '?partial=1'),
+            Scenario('notes:search', f"{reverse('notes')}?q={word}"),
+            Scenario('notes:create', reverse('notes'), 'post',
+                     {'title': 'Bench', 'content': 'Benchmark note'}, writes=True),
+            Scenario('edit_note', reverse('edit_note', args=[active[0]])),
+            Scenario('edit_note:save', reverse('edit_note', args=[active[0]]), 'post',
+                     {'title': 'Edited', 'content': 'Edited content'}, writes=True),
+            Scenario('autosave_note', reverse('autosave_note', args=[active[0]]), 'post',
+                     json.dumps({'version': note.version, 'changes': [[0, 0, 'Edited ']]}),
+                     content_type='application/json', writes=True),
+            Scenario('note_revisions', reverse('note_revisions', args=[revision.note_id])),
+            Scenario('note_revision', reverse('note_revision', args=[revision.note_id, revision.pk])),
+            Scenario('note_revision:restore',
+                     reverse('note_revision', args=[revision.note_id, revision.pk]), 'post', writes=True),
+            Scenario('archive', reverse('archive')),
+            Scenario('trash', reverse('trash')),
+            Scenario('archive_note', reverse('archive_note', args=[active[0]]), writes=True),
+            Scenario('unarchive_note', reverse('unarchive_note', args=[archived[0]]), writes=True),
+            Scenario('trash_note', reverse('trash_note', args=[active[0]]), writes=True),
+            Scenario('restore_note', reverse('restore_note', args=[trashed[0]]), writes=True),
+            Scenario('delete_forever', reverse('delete_forever', args=[trashed[0]]), writes=True),
+            Scenario('empty_trash', reverse('empty_trash'), 'post', writes=True),
+            Scenario('bulk_action', reverse('bulk_action'), 'post',
+                     {'action': 'archive', 'ids': active}, writes=True),
+            Scenario('job_status', reverse('job_status', args=[job.pk])),
+            Scenario('sync_notes', reverse('sync_notes')),
+            Scenario('sync_notes:current', f"{reverse('sync_notes')}?cursor={head}"),
+            Scenario('export_notes', reverse('export_notes')),
+            Scenario('export_notes:markdown', f"{reverse('export_notes')}?format=markdown"),
+            Scenario('import_notes', reverse('import_notes'), 'post', self.import_body(),
+                     headers={'Accept': 'application/json'},
+                     content_type='multipart/form-data; boundary=bench', writes=True),
+            Scenario('profile', reverse('profile')),
+            Scenario('profile:save', reverse('profile'), 'post',
+                     {'first_name': user.first_name, 'last_name': user.last_name}, writes=True),
+            Scenario('metrics', reverse('metrics'), headers={'Authorization': 'Bearer bench'}),
+            Scenario('login', reverse('login'), anonymous=True),
+            Scenario('login:post', reverse('login'), 'post',
+                     {'username': user.username, 'password': password},
+                     anonymous=True, writes=True),
+            Scenario('signup', reverse('signup'), anonymous=True),
+            Scenario('signup:post', reverse('signup'), 'post', {
+                'username': 'bench-signup', 'password': 'bench-signup-pw',
+                'password2': 'bench-signup-pw', 'first_name': 'Bench',
+            }, anonymous=True, writes=True),
+            Scenario('logout', reverse('logout'), writes=True, relogin=True),
+        ]
+
+    def import_body(self, notes=100):
+        # Encoded once: the test client does not rewind files between requests.
+        lines = ''.join(
+            json.dumps({'title': f'Imported {i}', 'content': 'Imported note body ' * 20}) + '\n'
+            for i in range(notes)
+        )
+        return encode_multipart('bench', {'file': SimpleUploadedFile('notes.ndjson', lines.encode())})
+
+    def warn_uncovered(self, scenarios):
+        covered = {scenario.name.split(':')[0] for scenario in scenarios}
+        for pattern in urlpatterns:
+            if pattern.name not in covered:
+                self.stderr.write(f'No benchmark scenario for URL {pattern.name!r}.')
+
+    def run(self, scenario, client, user, options):
+        timings, queries, sizes = [], [], []
+        for i in range(options['warmup'] + options['iterations']):
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured, transaction.atomic():
+                start = time.perf_counter()
+                extra = {'content_type': scenario.content_type} if scenario.content_type else {}
+                response = getattr(client, scenario.method)(
+                    scenario.url, scenario.data, headers=scenario.headers, **extra,
+                )
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                elapsed = time.perf_counter() - start
+                if scenario.writes:
+                    transaction.set_rollback(True)
+            if scenario.relogin:
+                client.force_login(user)
+            if response.status_code >= 400:
+                raise CommandError(f'{scenario.name}: HTTP {response.status_code}')
+            if i >= options['warmup']:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+                sizes.append(len(body))
+
+        cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {
+            'p50': round(cuts[49], 3),
+            'p95': round(cuts[94], 3),
+            'p99': round(cuts[98], 3),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"scenario":<24} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"bytes":>9}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<24} {result["p50"]:>9.2f} {result["p95"]:>9.2f} {result["p99"]:>9.2f} '
+                f'{result["queries"]:>8} {result["bytes"]:>9}'
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            base = baseline[name]
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: {base["queries"]} -> {result["queries"]} queries')
+            for metric in ('p95', 'bytes'):
+                if result[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f'{name}: {metric} {base[metric]} -> {result[metric]}')
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}.'))
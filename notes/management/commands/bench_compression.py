@@ -0,0 +1,142 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from notes.compression import pack, text
+from notes.models import Note
+from notes.search import FTS_TABLE
+
+TABLES = (('notes_note', 'content'), ('notes_noterevision', 'data'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare disk size and read latency of the notes tables with every '
+        'body stored as plain text and with bodies of at least '
+        'NOTE_COMPRESS_MIN_LENGTH characters compressed. Works on two '
+        'vacuumed copies of the SQLite database; the database itself is '
+        'not changed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=200,
+                            help='Number of large notes to read.')
+        parser.add_argument('--iterations', type=int, default=5,
+                            help='Reads of each sampled note.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_compression only runs against SQLite.')
+        ids = list(
+            Note.objects.filter(content_length__gte=settings.NOTE_COMPRESS_MIN_LENGTH)
+            .order_by('id').values_list('id', flat=True)
+        )
+        if not ids:
+            raise CommandError(
+                f'No notes of at least {settings.NOTE_COMPRESS_MIN_LENGTH} characters; '
+                f'seed some with seed_notes --sizes.'
+            )
+        sample = random.Random(options['seed']).sample(ids, min(options['samples'], len(ids)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            results = {}
+            for name, convert in (('plain', self.decompress), ('compressed', self.compress)):
+                path = Path(tmp) / f'{name}.sqlite3'
+                db = self.copy(path)
+                convert(db)
+                # Rewriting bodies fired the search triggers; merge the
+                # index segments they left so both copies compare evenly.
+                db.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+                db.execute('VACUUM')
+                tables, fts = self.table_bytes(db)
+                results[name] = {
+                    'file': os.path.getsize(path),
+                    'tables': tables,
+                    'fts': fts,
+                    **self.read_latency(db, sample, options['iterations']),
+                }
+                db.close()
+        self.report(results, len(ids))
+
+    def copy(self, path):
+        connection.ensure_connection()
+        db = sqlite3.connect(path, isolation_level=None)
+        db.create_function('notes_text', 1, text, deterministic=True)
+        connection.connection.backup(db)
+        db.execute('PRAGMA journal_mode=DELETE')
+        return db
+
+    def decompress(self, db):
+        for table, column in TABLES:
+            db.execute(f"UPDATE {table} SET {column} = notes_text({column}) WHERE typeof({column}) = 'blob'")
+
+    def compress(self, db):
+        db.execute('BEGIN')
+        for table, column in TABLES:
+            rows = db.execute(
+                f"SELECT id, {column} FROM {table} WHERE typeof({column}) = 'text' AND length({column}) >= ?",
+                [settings.NOTE_COMPRESS_MIN_LENGTH],
+            ).fetchall()
+            db.executemany(
+                f'UPDATE {table} SET {column} = ? WHERE id = ?',
+                [(pack(value), pk) for pk, value in rows],
+            )
+        db.execute('COMMIT')
+
+    def table_bytes(self, db):
+        """Bytes used by the notes and revision tables plus the search
+        index's shadow tables, and by the index alone."""
+        names = [table for table, _ in TABLES]
+        try:
+            tables, fts = db.execute(
+                f'SELECT SUM(pgsize), SUM(CASE WHEN name LIKE ? THEN pgsize END) FROM dbstat '
+                f'WHERE name IN ({",".join("?" * len(names))}) OR name LIKE ?',
+                [f'{FTS_TABLE}_%', *names, f'{FTS_TABLE}_%'],
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None, None  # SQLite built without dbstat
+        return tables, fts or 0
+
+    def read_latency(self, db, ids, iterations):
+        timings = []
+        for _ in range(iterations):
+            for pk in ids:
+                start = time.perf_counter()
+                value = db.execute('SELECT content FROM notes_note WHERE id = ?', [pk]).fetchone()[0]
+                text(value)
+                timings.append((time.perf_counter() - start) * 1000)
+        cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {'p50': cuts[49], 'p95': cuts[94]}
+
+    def report(self, results, large):
+        self.stdout.write(f'{large} notes of at least {settings.NOTE_COMPRESS_MIN_LENGTH} characters.')
+        self.stdout.write(
+            f'{"storage":<12} {"file":>12} {"tables":>12} {"search index":>12} '
+            f'{"read p50 ms":>12} {"read p95 ms":>12}'
+        )
+        for name, result in results.items():
+            tables, fts = (
+                ('-', '-') if result['tables'] is None
+                else (f'{result["tables"]:,}', f'{result["fts"]:,}')
+            )
+            self.stdout.write(
+                f'{name:<12} {result["file"]:>12,} {tables:>12} {fts:>12} '
+                f'{result["p50"]:>12.3f} {result["p95"]:>12.3f}'
+            )
+        plain, compressed = results['plain'], results['compressed']
+        summary = f'Compressed file is {compressed["file"] / plain["file"]:.0%} of the plain one'
+        if plain['tables']:
+            summary += (
+                f'; its notes, revision and search index tables are '
+                f'{compressed["tables"] / plain["tables"]:.0%}'
+            )
+        self.stdout.write(self.style.SUCCESS(summary + '.'))
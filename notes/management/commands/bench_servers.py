@@ -0,0 +1,149 @@
+import http.client
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/', '/archive/', '/trash/', '/?q=note']
+
+
+class Command(BaseCommand):
+    help = (
+        'Start gunicorn in WSGI and then ASGI mode with the same number of '
+        'workers and measure how many note pages each serves to a logged-in '
+        'user under concurrent load.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose pages are requested.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Simultaneous keep-alive client connections.')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds of load per mode.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f'Page to request; repeatable. Default: {DEFAULT_PATHS}.')
+        parser.add_argument('--mode', action='append', dest='modes',
+                            choices=['wsgi', 'asgi'],
+                            help='Only run these SERVER_MODEs. Default: both.')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        modes = options['modes'] or ['wsgi', 'asgi']
+        for module in ['gunicorn'] + (['uvicorn'] if 'asgi' in modes else []):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'{module} is not installed.')
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]!r}.')
+
+        session = self._login(user)
+        try:
+            for mode in modes:
+                result = self._bench(mode, session.session_key, options)
+                self.stdout.write(
+                    f'{mode}: {result["requests"]} requests, '
+                    f'{result["rps"]:.1f} req/s, '
+                    f'p50 {result["p50"]:.1f} ms, p95 {result["p95"]:.1f} ms, '
+                    f'{result["errors"]} errors'
+                )
+        finally:
+            session.delete()
+
+    def _login(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    def _bench(self, mode, session_key, options):
+        port = options['port']
+        env = {**os.environ, 'SERVER_MODE': mode, 'ASYNC_VIEWS': str(mode == 'asgi')}
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn',
+             '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}',
+             '--workers', str(options['workers'])],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self._wait_for(port, server)
+            return self._load(port, session_key, options)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def _wait_for(self, port, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited during startup.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'gunicorn did not start listening on port {port}.')
+
+    def _load(self, port, session_key, options):
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session_key}'}
+        deadline = time.monotonic() + options['duration']
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def client(offset):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            own_latencies, own_errors, i = [], 0, offset
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', paths[i % len(paths)], headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        own_errors += 1
+                except (OSError, http.client.HTTPException):
+                    own_errors += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                own_latencies.append((time.perf_counter() - start) * 1000)
+                i += 1
+            conn.close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors.append(own_errors)
+
+        threads = [
+            threading.Thread(target=client, args=(n,))
+            for n in range(options['concurrency'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0] * 19
+        return {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50': quantiles[9],
+            'p95': quantiles[18],
+            'errors': sum(errors),
+        }
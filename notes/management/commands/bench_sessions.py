@@ -0,0 +1,129 @@
+import statistics
+import tempfile
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from notes.management.commands.bench import Command as BenchCommand
+from notes.models import ChangeCounter
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+def modes(tmp):
+    """(name, settings) for each SESSION_BACKEND / SESSION_CACHE pair."""
+    caches = {
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tmp,
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bench-sessions',
+        },
+    }
+    yield 'db', {'SESSION_ENGINE': ENGINES['db']}
+    for name, cache in caches.items():
+        yield f'cached_db+{name}', {
+            'SESSION_ENGINE': ENGINES['cached_db'],
+            'CACHES': {**settings.CACHES, 'sessions': cache},
+            'SESSION_CACHE_ALIAS': 'sessions',
+        }
+    yield 'signed_cookies', {'SESSION_ENGINE': ENGINES['signed_cookies']}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what sessions cost each request under every SESSION_BACKEND '
+        '(and SESSION_CACHE for cached_db): loading a session, as every '
+        'authenticated request does, saving one, as a request that changes '
+        'it does, and a whole request to a page that does little else, with '
+        'its django_session queries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as (default: first bench-* user).')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = BenchCommand().get_user(options['user'])
+        head = ChangeCounter.objects.filter(user=user).values_list('value', flat=True).first() or 0
+        # The cheapest authenticated page: a sync that is already up to date.
+        url = f"{reverse('sync_notes')}?cursor={head}"
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, overrides in modes(tmp):
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **overrides):
+                    results[name] = self.run(user, url, options)
+        self.report(results)
+
+    def run(self, user, url, options):
+        client = Client()
+        client.force_login(user)
+        key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        total = options['warmup'] + options['iterations']
+        loads, saves, requests, queries = [], [], [], []
+        try:
+            for i in range(total):
+                start = time.perf_counter()
+                session = store(key)
+                session.load()
+                loads.append(time.perf_counter() - start)
+
+                session['bench'] = i
+                start = time.perf_counter()
+                session.save()
+                saves.append(time.perf_counter() - start)
+                # A signed cookie is a new value after every save.
+                key = session.session_key
+                client.cookies[settings.SESSION_COOKIE_NAME] = key
+
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    requests.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} returned {response.status_code}.')
+                queries.append(sum('django_session' in q['sql'] for q in captured.captured_queries))
+        finally:
+            store(key).delete()
+        warm = slice(options['warmup'], None)
+        return {
+            'load': self.percentiles(loads[warm]),
+            'save': self.percentiles(saves[warm]),
+            'request': self.percentiles(requests[warm]),
+            'queries': statistics.mean(queries[warm]),
+        }
+
+    def percentiles(self, timings):
+        timings = [t * 1000 for t in timings]
+        cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {'p50': cuts[49], 'p95': cuts[94]}
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"sessions":<18} {"load p50":>9} {"load p95":>9} {"save p50":>9} {"save p95":>9} '
+            f'{"req p50":>9} {"req p95":>9} {"session queries":>16}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<18} '
+                + ' '.join(
+                    f'{result[part][cut]:>9.3f}'
+                    for part in ('load', 'save', 'request') for cut in ('p50', 'p95')
+                )
+                + f' {result["queries"]:>16.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS('Times in ms; session queries are per request.'))
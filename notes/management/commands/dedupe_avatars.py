@@ -0,0 +1,92 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.avatars import AVATAR_DIR, LETTER_AVATARS, avatar_storage, is_content_name
+from notes.models import Profile
+
+# Files younger than this are left alone: an upload is stored before the
+# profile that uses it is saved.
+ORPHAN_GRACE = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move profile pictures stored under per-user names into the '
+        'content-addressed avatar store and delete the old copies, then '
+        'delete stored avatars, and their renditions, that no profile uses.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without touching anything.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = missing = 0
+        old_names = set()
+        profiles = Profile.objects.exclude(profile_picture='').exclude(profile_picture=None)
+        for profile in profiles.only('id', 'user_id', 'profile_picture').iterator():
+            name = profile.profile_picture.name
+            if is_content_name(name):
+                continue
+            if not avatar_storage.exists(name):
+                missing += 1
+                continue
+            moved += 1
+            old_names.add(name)
+            if dry_run:
+                continue
+            with avatar_storage.open(name) as f:
+                profile.profile_picture.name = avatar_storage.save(name, f)
+            profile.save(update_fields=['profile_picture'])
+
+        deleted = 0
+        for name in sorted(old_names):
+            if dry_run or Profile.objects.filter(profile_picture=name).exists():
+                continue
+            avatar_storage.delete(name)
+            deleted += 1
+
+        orphans = self.orphans()
+        if not dry_run:
+            for name in orphans:
+                avatar_storage.delete(name)
+
+        prefix = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {moved} avatars into the shared store; '
+            f'deleted {deleted} old files, {missing} were already missing. '
+            f'{"Would remove" if dry_run else "Removed"} {len(orphans)} unused files.'
+        ))
+
+    def orphans(self):
+        """Names of stored avatars and renditions that no profile uses,
+        older than ORPHAN_GRACE."""
+        if not avatar_storage.exists(AVATAR_DIR):
+            return []
+        used = set(Profile.objects.values_list('profile_picture', flat=True).distinct())
+        # Running processes remember the letter avatars as stored; keep them.
+        used.update(
+            f'{AVATAR_DIR}/{hashlib.sha256(data).hexdigest()}.svg'
+            for data in LETTER_AVATARS.values()
+        )
+        stems = {
+            os.path.splitext(os.path.basename(name))[0] for name in used if is_content_name(name)
+        }
+        dirs, files = avatar_storage.listdir(AVATAR_DIR)
+        names = [
+            name for name in (f'{AVATAR_DIR}/{filename}' for filename in files)
+            if is_content_name(name) and name not in used
+        ]
+        for size in filter(str.isdigit, dirs):
+            _, files = avatar_storage.listdir(f'{AVATAR_DIR}/{size}')
+            names += [
+                f'{AVATAR_DIR}/{size}/{filename}' for filename in files
+                if os.path.splitext(filename)[0] not in stems
+            ]
+        cutoff = timezone.now() - ORPHAN_GRACE
+        return [name for name in names if avatar_storage.get_modified_time(name) < cutoff]
@@ -0,0 +1,36 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import transfer
+
+FORMATS = {'ndjson': transfer.export_ndjson, 'markdown': transfer.export_markdown}
+
+
+class Command(BaseCommand):
+    help = (
+        "Write all of a user's notes as NDJSON (the import_notes format) or "
+        'a zip of Markdown files, streaming them in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o',
+                            help='File to write (default: standard output).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]!r}.')
+        chunks = FORMATS[options['format']](user.pk)
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                size = sum(f.write(chunk) for chunk in chunks)
+            self.stderr.write(f'Wrote {size} bytes to {options["output"]}.')
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
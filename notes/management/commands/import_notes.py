@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Add the notes in an NDJSON export to a user, reading the file a '
+        'line at a time and inserting them in batches, one transaction each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=transfer.IMPORT_BATCH_SIZE,
+                            help='Notes per INSERT and transaction.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be >= 1.')
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]!r}.')
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                count = transfer.import_ndjson(user.pk, f, options['batch_size'])
+        except transfer.InvalidImport as exc:
+            raise CommandError(f'Imported {exc.imported} notes, then stopped. {exc}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {count} notes in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} notes/s).'
+        ))
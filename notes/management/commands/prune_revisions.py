@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes import revisions
+from notes.models import NoteRevision
+
+
+class Command(BaseCommand):
+    help = (
+        'Thin out note history: keep every revision from the last day, one '
+        'per hour for the last week, one per day up to '
+        'REVISION_RETENTION_DAYS, and drop the rest. Each note is rewritten '
+        'in its own short transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between notes.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - revisions.THINNING[0][0]
+        note_ids = list(
+            NoteRevision.objects.filter(created_at__lt=cutoff)
+            .values_list('note_id', flat=True).distinct().order_by('note_id')
+        )
+        dropped = notes = 0
+        started = time.monotonic()
+        for note_id in note_ids:
+            count = revisions.prune(note_id, now)
+            if count:
+                dropped += count
+                notes += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Dropped {dropped} revisions from {notes} notes in {elapsed:.1f}s.'
+        ))
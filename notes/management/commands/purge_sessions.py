@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired rows from django_session, like clearsessions but '
+        'in batches of short transactions with a pause between them, so '
+        'the app keeps getting the write lock. Cached copies of those '
+        'sessions expire from the cache by themselves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Sessions deleted by each DELETE.')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be >= 1.')
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+        if options['dry_run']:
+            self.stdout.write(f'Would purge {expired.count()} sessions.')
+            return
+
+        batch_size = options['batch_size']
+        deleted = 0
+        started = time.monotonic()
+        while True:
+            with transaction.atomic():
+                keys = list(expired.order_by('expire_date').values_list('session_key', flat=True)[:batch_size])
+                count, _ = Session.objects.filter(session_key__in=keys).delete() if keys else (0, {})
+            deleted += count
+            if len(keys) < batch_size:
+                break
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{deleted} purged ({deleted / elapsed:.0f} sessions/s)')
+            time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {deleted} sessions in {elapsed:.1f}s '
+            f'({deleted / max(elapsed, 1e-9):.0f} sessions/s).'
+        ))
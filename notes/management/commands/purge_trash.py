@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from notes import listcache
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete notes that have been in the trash longer than the retention '
+        'period in batches of expired ids, pausing between batches so the '
+        'app keeps getting the write lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRASH_RETENTION_DAYS,
+                            help='Purge notes trashed more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Notes deleted by each DELETE.')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days must be >= 0 and --batch-size >= 1.')
+        expired = Note.objects.expired_trash(options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'Would purge {expired.count()} notes.')
+            return
+
+        batch_size = options['batch_size']
+        deleted = 0
+        last = 0
+        started = time.monotonic()
+        while True:
+            # The next expired ids, however sparse, not the next id range.
+            ids = list(expired.filter(id__gt=last).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last = ids[-1]
+            batch = expired.filter(id__in=ids)
+            with transaction.atomic():
+                user_ids = set(batch.values_list('user_id', flat=True))
+                count = batch.delete_forever() if user_ids else 0
+            for user_id in user_ids:
+                listcache.bump_generation(user_id)
+            deleted += count
+            if count:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'ids {ids[0]}-{last}: {deleted} purged '
+                    f'({deleted / elapsed:.0f} notes/s)'
+                )
+                time.sleep(options['sleep'])
+
+        if not deleted:
+            self.stdout.write('Nothing to purge.')
+            return
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {deleted} notes in {elapsed:.1f}s '
+            f'({deleted / max(elapsed, 1e-9):.0f} notes/s).'
+        ))
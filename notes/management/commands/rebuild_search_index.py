@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from notes.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all notes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        count = rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} notes.'))
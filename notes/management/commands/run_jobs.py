@@ -0,0 +1,81 @@
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from notes.jobs import requeue_stale, run_job, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs. Several workers, on one host or many, '
+        'can run against the same database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Jobs run at once by each process.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes to fork.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            self.work(options)
+            return
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        children = [
+            multiprocessing.Process(target=self.work, args=(options,))
+            for _ in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+
+        def stop(*args):
+            # Each child finishes its current job, then exits.
+            for child in children:
+                child.terminate()
+
+        previous = signal.signal(signal.SIGTERM, stop)
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            stop()
+            for child in children:
+                child.join()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    def work(self, options):
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        done = 0
+        threads = options['threads']
+        pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        try:
+            while not stop.is_set():
+                requeue_stale()
+                # One thread runs jobs itself; more take one slot each.
+                jobs = pool.map(self.run_one, range(threads)) if pool else [self.run_one(0)]
+                ran = sum(1 for job in jobs if job)
+                done += ran
+                if not ran:
+                    if options['burst']:
+                        break
+                    stop.wait(options['poll'])
+        finally:
+            if pool:
+                pool.shutdown()
+        self.stdout.write(f'{worker_name()}: ran {done} jobs.')
+
+    def run_one(self, slot):
+        close_old_connections()
+        return run_job(worker=worker_name(f':{slot}'))
@@ -0,0 +1,124 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from notes.avatars import letter_avatar
+from notes.models import Note, Profile
+
+WORDS = (
+    'meeting agenda project budget review draft idea plan todo groceries '
+    'milk eggs bread coffee recipe travel flight hotel booking passport '
+    'birthday gift party invite call email follow up deadline report '
+    'quarterly sales design sketch wireframe feedback release notes bug fix '
+    'deploy server database backup password reminder doctor appointment '
+    'gym workout running book reading list movie music playlist garden '
+    'plants water weekly monthly summary journal thoughts lecture exam '
+    'chapter research paper citation holiday family weekend cleaning'
+).split()
+
+DEFAULT_PASSWORD = 'bench-password'
+
+
+def parse_sizes(value):
+    """Parse ``chars:weight,...`` into ([chars], [weights])."""
+    try:
+        pairs = [item.split(':') for item in value.split(',')]
+        sizes = [int(chars) for chars, _ in pairs]
+        weights = [float(weight) for _, weight in pairs]
+    except ValueError:
+        raise CommandError(f'Invalid --sizes {value!r}; expected e.g. "200:70,2000:25,20000:5".')
+    return sizes, weights
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create users with notes for benchmarking. The same --seed '
+        'always produces the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--notes', type=int, default=200, help='Notes per user.')
+        parser.add_argument('--sizes', default='200:70,2000:25,20000:5',
+                            help='Content length distribution as chars:weight pairs.')
+        parser.add_argument('--archived', type=float, default=0.1,
+                            help='Fraction of notes archived.')
+        parser.add_argument('--trashed', type=float, default=0.1,
+                            help='Fraction of notes in the trash.')
+        parser.add_argument('--prefix', default='bench', help='Username prefix.')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sizes, weights = parse_sizes(options['sizes'])
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named {prefix}-* already exist; pick another --prefix.')
+
+        started = time.monotonic()
+        password = make_password(options['password'])
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}-{i:04d}', first_name=rng.choice(WORDS).title(), password=password)
+                for i in range(options['users'])
+            ])
+            if not users or users[0].pk is None:
+                users = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('id'))
+            # bulk_create skips the signal that gives each user a profile.
+            Profile.objects.bulk_create([
+                Profile(user=user, profile_picture=letter_avatar(user.first_name))
+                for user in users
+            ])
+
+        now = timezone.now()
+        total = 0
+        batch = []
+        for user in users:
+            for _ in range(options['notes']):
+                length = rng.choices(sizes, weights)[0]
+                roll = rng.random()
+                trashed = roll < options['trashed']
+                note = Note(
+                    user=user,
+                    title=' '.join(rng.choices(WORDS, k=rng.randint(1, 5))).capitalize(),
+                    content=self.text(rng, length),
+                    archived=not trashed and roll < options['trashed'] + options['archived'],
+                    trashed=trashed,
+                    trashed_at=now if trashed else None,
+                )
+                # bulk_create skips save(), which fills these in.
+                note.refresh_preview()
+                batch.append(note)
+                if len(batch) >= options['batch_size']:
+                    total += self.flush(batch)
+        total += self.flush(batch)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users and {total} notes in {elapsed:.1f}s '
+            f'({total / max(elapsed, 1e-9):.0f} notes/s).'
+        ))
+
+    def text(self, rng, length):
+        words = []
+        size = 0
+        while size <= length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words)[:length]
+
+    def flush(self, batch):
+        count = len(batch)
+        if count:
+            with transaction.atomic():
+                Note.objects.bulk_create(batch)
+            batch.clear()
+        return count
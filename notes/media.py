@@ -0,0 +1,140 @@
+"""Serving uploaded media (avatars) in production.
+
+Files are streamed with FileResponse rather than read into memory, answer
+``If-None-Match``/``If-Modified-Since`` with 304 and single byte ranges with
+206. Names carrying a content hash never change content, so they are cached
+for a year as ``immutable``; anything else must be revalidated.
+
+With MEDIA_ACCEL set, the view only checks the request and answers with an
+``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd) header,
+leaving the proxy to send the bytes and handle ranges.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# A hex digest of 16+ characters as the last part of the file's stem.
+_HASHED_NAME_RE = re.compile(r'(?:^|[/._-])[0-9a-f]{16,}\.\w+$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _FileRange:
+    """Read-only view of bytes ``start..end`` (inclusive) of an open file."""
+
+    def __init__(self, file, start, end):
+        file.seek(start)
+        self.file = file
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_hashed_name(path):
+    return bool(_HASHED_NAME_RE.search(path))
+
+
+def parse_range(header, size):
+    """Return the ``(start, end)`` of a single-range ``Range`` header.
+
+    Returns None when the header should be ignored (malformed or several
+    ranges, which may be answered with the whole file) and raises
+    ValueError when the range lies outside the file.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # "bytes=-N": the last N bytes.
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (OSError, ValueError):
+        raise Http404('Media file not found.')
+    if not os.path.isfile(fullpath):
+        raise Http404('Media file not found.')
+
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime),
+    )
+    if response is None:
+        response = _file_response(request, path, fullpath, stat.st_size, etag)
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    if is_hashed_name(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _file_response(request, path, fullpath, size, etag):
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Sendfile'] = fullpath
+        return response
+
+    span = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            span = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response.headers['Content-Length'] = size
+    elif span is None:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    else:
+        start, end = span
+        response = FileResponse(
+            _FileRange(open(fullpath, 'rb'), start, end),
+            content_type=content_type,
+            status=206,
+        )
+        response.headers['Content-Length'] = end - start + 1
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:10
+
+from django.db import migrations
+
+from notes import search
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        search.install(schema_editor)
+        return
+    # Bodies were not compressed yet (see 0013).
+    for sql in search.LEGACY_SQLITE_SCHEMA:
+        schema_editor.execute(sql.replace('notes_text(new.content)', 'new.content'))
+    schema_editor.execute(
+        f'INSERT INTO {search.FTS_TABLE}(rowid, title, content) '
+        f'SELECT id, title, content FROM notes_note'
+    )
+
+
+def backwards(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_remove_note_color_pinned'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
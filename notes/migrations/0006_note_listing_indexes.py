@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_note_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('archived', False), ('trashed', False)), fields=['user', 'updated_at'], name='note_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('archived', True), ('trashed', False)), fields=['user', 'updated_at'], name='note_archived_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('trashed', True)), fields=['user', 'updated_at'], name='note_trash_idx'),
+        ),
+    ]
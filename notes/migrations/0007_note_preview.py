@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:47
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import Length, Substr
+
+PREVIEW_LENGTH = 500
+BATCH_SIZE = 2000
+
+
+def backfill_previews(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    db = schema_editor.connection.alias
+    last_id = Note.objects.using(db).aggregate(Max('id'))['id__max'] or 0
+    # Set-based UPDATEs over bounded id ranges keep each write transaction short.
+    for start in range(0, last_id, BATCH_SIZE):
+        Note.objects.using(db).filter(id__gt=start, id__lte=start + BATCH_SIZE).update(
+            preview=Substr('content', 1, PREVIEW_LENGTH),
+            content_length=Length('content'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_note_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='content_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.RunPython(backfill_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:09
+
+import notes.avatars
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_note_preview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, default=None, null=True, storage=notes.avatars.get_avatar_storage, upload_to='avatars/'),
+        ),
+    ]
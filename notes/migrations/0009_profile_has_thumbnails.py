@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_profile_content_addressed_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_trashed_at(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    # Trashing stamps updated_at, so it is the best estimate for old rows.
+    Note.objects.using(schema_editor.connection.alias).filter(
+        trashed=True, trashed_at=None,
+    ).update(trashed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='trashed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_trashed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('trashed', True)), fields=['trashed_at'], name='note_trashed_at_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:50
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+import notes.compression
+from notes import search
+
+BATCH_SIZE = 500
+
+OLD_TRIGGERS = [
+    sql.replace('notes_text(new.content)', 'new.content') for sql in search.LEGACY_SQLITE_SCHEMA[1:]
+]
+
+
+def drop_triggers(schema_editor):
+    for suffix in ('ai', 'au', 'ad'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {search.FTS_TABLE}_{suffix}')
+
+
+def inflating_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_triggers(schema_editor)
+        for sql in search.LEGACY_SQLITE_SCHEMA[1:]:
+            schema_editor.execute(sql)
+
+
+def plain_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_triggers(schema_editor)
+        for sql in OLD_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def compress(apps, schema_editor):
+    """Rewrite large bodies and snapshots, BATCH_SIZE rows per transaction;
+    saving them through CompressedTextField compresses them."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    alias = schema_editor.connection.alias
+    for model_name, field, scope in (
+        ('Note', 'content', {}),
+        ('NoteRevision', 'data', {'is_snapshot': True}),
+    ):
+        model = apps.get_model('notes', model_name)
+        rows = model.objects.using(alias).filter(
+            content_length__gte=settings.NOTE_COMPRESS_MIN_LENGTH, **scope,
+        ).only('id', field).order_by('id')
+        last = 0
+        while batch := list(rows.filter(id__gt=last)[:BATCH_SIZE]):
+            with transaction.atomic(using=alias):
+                model.objects.using(alias).bulk_update(batch, [field])
+            last = batch[-1].id
+
+
+def decompress(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in (('notes_note', 'content'), ('notes_noterevision', 'data')):
+        schema_editor.execute(
+            f"UPDATE {table} SET {column} = notes_text({column}) WHERE typeof({column}) = 'blob'"
+        )
+
+
+class Migration(migrations.Migration):
+    # Each batch of compress() commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0012_noterevision'),
+    ]
+
+    operations = [
+        # The column stays TEXT; only the Python side changes, so there is
+        # no table to rebuild.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='note',
+                name='content',
+                field=notes.compression.CompressedTextField(),
+            ),
+            migrations.AlterField(
+                model_name='noterevision',
+                name='data',
+                field=notes.compression.CompressedTextField(),
+            ),
+        ]),
+        migrations.RunPython(inflating_triggers, plain_triggers),
+        migrations.RunPython(compress, decompress),
+    ]
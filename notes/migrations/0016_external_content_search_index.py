@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:40
+
+from django.db import migrations
+
+from notes import search
+
+
+def forwards(apps, schema_editor):
+    """Replace the index that kept its own uncompressed copy of every body
+    with an external-content one (see search.py)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.uninstall(schema_editor)
+    search.install(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.uninstall(schema_editor)
+    for sql in search.LEGACY_SQLITE_SCHEMA:
+        schema_editor.execute(sql)
+    schema_editor.execute(
+        f'INSERT INTO {search.FTS_TABLE}(rowid, title, content) '
+        f'SELECT id, title, notes_text(content) FROM notes_note'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0015_change_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -1,64 +1,353 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.files.base import ContentFile
-from django.conf import settings
-import os
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from .avatars import Avatar, get_avatar_storage, letter_avatar
+from .compression import CompressedTextField
+
+
+PREVIEW_LENGTH = 500
+DELETE_BATCH_SIZE = 500
+
+# Columns the listing templates render; everything else, notably the
+# unbounded `content`, stays deferred.
+LISTING_FIELDS = (
+    'id', 'user_id', 'title', 'preview', 'content_length',
+    'updated_at', 'archived', 'trashed',
+)
+
+
+class NoteQuerySet(models.QuerySet):
+    """The listing filters, each matching one of Note's partial indexes."""
+
+    def active(self, user):
+        return self.filter(user=user, archived=False, trashed=False)
+
+    def archived(self, user):
+        return self.filter(user=user, archived=True, trashed=False)
+
+    def in_trash(self, user):
+        return self.filter(user=user, trashed=True)
+
+    # State changes are set-based UPDATEs (one per owner) that touch only
+    # the flag columns; each returns the number of notes changed.
+
+    def archive(self):
+        return self._set_flags(archived=True)
+
+    def unarchive(self):
+        return self._set_flags(archived=False)
+
+    def trash(self):
+        return self._set_flags(trashed=True, archived=False, trashed_at=timezone.now())
+
+    def restore(self):
+        return self._set_flags(trashed=False, trashed_at=None)
+
+    def expired_trash(self, days):
+        """Notes trashed more than `days` days ago, for purge_trash."""
+        cutoff = timezone.now() - timedelta(days=days)
+        return self.filter(trashed=True, trashed_at__lt=cutoff)
+
+    def delete_forever(self):
+        """Delete the notes, leaving a NoteTombstone for each so sync
+        clients learn they are gone."""
+        with transaction.atomic(using=self.db):
+            rows = list(self.values_list('id', 'user_id'))
+            if not rows:
+                return 0
+            by_user = defaultdict(list)
+            for note_id, user_id in rows:
+                by_user[user_id].append(note_id)
+            tombstones = []
+            for user_id, note_ids in by_user.items():
+                seq = next_change_seq(user_id, self.db)
+                tombstones += [
+                    NoteTombstone(user_id=user_id, note_id=note_id, change_seq=seq)
+                    for note_id in note_ids
+                ]
+            NoteTombstone.objects.using(self.db).bulk_create(tombstones)
+            deleted = self.filter(id__in=[note_id for note_id, _ in rows]).delete()[1]
+        return deleted.get(Note._meta.label, 0)
+
+    def delete_in_batches(self, batch_size=DELETE_BATCH_SIZE):
+        """Delete the notes `batch_size` at a time, each batch in its own
+        transaction, so a huge delete never holds the write lock for long.
+        Returns the number deleted."""
+        deleted = 0
+        while ids := list(self.values_list('id', flat=True)[:batch_size]):
+            with transaction.atomic(using=self.db):
+                deleted += Note.objects.using(self.db).filter(id__in=ids).delete_forever()
+        return deleted
+
+    def _set_flags(self, **flags):
+        now = timezone.now()
+        changed = 0
+        with transaction.atomic(using=self.db):
+            for user_id in self.order_by().values_list('user_id', flat=True).distinct():
+                changed += self.filter(user_id=user_id).update(
+                    **flags, updated_at=now, change_seq=next_change_seq(user_id, self.db),
+                )
+        return changed
 
 
 class Note(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200, blank=True)
-    content = models.TextField()
+    content = CompressedTextField()
+    preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    content_length = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
     trashed = models.BooleanField(default=False)
+    # When the note was last moved to the trash; see TRASH_RETENTION_DAYS.
+    trashed_at = models.DateTimeField(null=True, blank=True)
+    # Goes up with every save of the title or content; the editor's
+    # autosave sends the version it started from to detect conflicts.
+    version = models.PositiveIntegerField(default=1)
+    # Position of the note's last change in its owner's change sequence;
+    # see sync.py.
+    change_seq = models.BigIntegerField(default=0)
+
+    objects = NoteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'updated_at'],
+                condition=models.Q(archived=False, trashed=False),
+                name='note_active_idx',
+            ),
+            models.Index(
+                fields=['user', 'updated_at'],
+                condition=models.Q(archived=True, trashed=False),
+                name='note_archived_idx',
+            ),
+            models.Index(
+                fields=['user', 'updated_at'],
+                condition=models.Q(trashed=True),
+                name='note_trash_idx',
+            ),
+            models.Index(
+                fields=['trashed_at'],
+                condition=models.Q(trashed=True),
+                name='note_trashed_at_idx',
+            ),
+            models.Index(fields=['user', 'change_seq'], name='note_change_seq_idx'),
+        ]
 
     def __str__(self):
         return self.title if self.title else 'Untitled Note'
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.refresh_preview()
+        elif 'content' in update_fields:
+            self.refresh_preview()
+            kwargs['update_fields'] = {*update_fields, 'preview', 'content_length'}
+        bump = not self._state.adding and (
+            update_fields is None or not {'title', 'content'}.isdisjoint(update_fields)
+        )
+        if bump:
+            # In SQL, so a save from a stale instance still moves it on.
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        if update_fields:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self.change_seq = next_change_seq(self.user_id, using)
+            super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
+    def refresh_preview(self):
+        """Recompute the denormalized columns derived from `content`.
+
+        Called by save(); code that writes through bulk_create() or
+        update() must call it (or set the columns) itself.
+        """
+        content = self.content or ''
+        self.preview = content[:PREVIEW_LENGTH]
+        self.content_length = len(content)
+
+    @property
+    def is_truncated(self):
+        return self.content_length > len(self.preview)
+
+
+class NoteRevision(models.Model):
+    """A saved state of a note; see revisions.py for how it is stored."""
+
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='revisions')
+    title = models.CharField(max_length=200, blank=True)
+    # The full content for a snapshot, otherwise a line delta against the
+    # previous revision.
+    is_snapshot = models.BooleanField(default=False)
+    data = CompressedTextField()
+    content_length = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(max_length=16)
+    # Deltas since the last snapshot, and their total size in characters.
+    depth = models.PositiveIntegerField(default=0)
+    chain_size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.note_id} @ {self.created_at:%Y-%m-%d %H:%M}'
+
+
+class ChangeCounter(models.Model):
+    """The last number handed out in a user's change sequence."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+
+def next_change_seq(user_id, using='default'):
+    """Hand out the next number in `user_id`'s change sequence.
+
+    Call it in the transaction making the change: the UPDATE locks the
+    counter row until that commits, so changes commit in sequence order.
+    """
+    counters = ChangeCounter.objects.using(using).filter(user_id=user_id)
+    if not counters.update(value=models.F('value') + 1):
+        ChangeCounter.objects.using(using).create(user_id=user_id, value=1)
+        return 1
+    return counters.values_list('value', flat=True).get()
+
+
+class NoteTombstone(models.Model):
+    """Marks a note deleted for good, so sync clients drop it too."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    note_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'change_seq'], name='tombstone_change_seq_idx'),
+        ]
+
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_picture = models.ImageField(
-        upload_to='profile_pics/',
+        upload_to='avatars/',
+        storage=get_avatar_storage,
         blank=True,
         null=True,
         default=None
     )
+    # Set once notes.images has written the resized renditions.
+    has_thumbnails = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @property
+    def avatar(self):
+        if not self.profile_picture:
+            return None
+        return Avatar(self.profile_picture.name, self.has_thumbnails)
+
+    @property
+    def avatar_url(self):
+        return self.profile_picture.url if self.profile_picture else None
 
-# Auto-create & save profile
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        profile = Profile.objects.create(user=instance)
-
-        # Use existing SVG avatars from static/avatars
-        try:
-            # Get first letter from first name, then last name, then username
-            initial = (instance.first_name or instance.last_name or instance.username or 'U')[:1].upper()
-            
-            # Path to the pre-made SVG avatar
-            svg_path = os.path.join(settings.BASE_DIR, 'static', 'avatars', f'{initial}.svg')
-            
-            # Read the SVG file and save it to profile_picture
-            if os.path.exists(svg_path):
-                with open(svg_path, 'rb') as f:
-                    svg_data = f.read()
-                
-                filename = f"{instance.username}_avatar.svg"
-                profile.profile_picture.save(filename, ContentFile(svg_data), save=True)
-        except Exception as e:
-            # fail silently; do not block user creation
-            pass
 
+class Job(models.Model):
+    """A unit of background work; see notes/jobs.py."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['run_after'],
+                condition=models.Q(status='queued'),
+                name='job_queued_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+AVATAR_CACHE_KEY = 'notes:avatar:v2:{user_id}'
+AVATAR_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _avatar_row(row):
+    return (row[0] or '', row[1]) if row else ('', False)
+
+
+def cached_avatar(user_id):
+    """Return the Avatar of `user_id`, or None, caching the lookup."""
+    key = AVATAR_CACHE_KEY.format(user_id=user_id)
+    value = cache.get(key)
+    if value is None:
+        value = _avatar_row(Profile.objects.filter(user_id=user_id).values_list(
+            'profile_picture', 'has_thumbnails',
+        ).first())
+        cache.set(key, value, AVATAR_CACHE_TIMEOUT)
+    return Avatar(*value) if value[0] else None
+
+
+async def acached_avatar(user_id):
+    """Async version of cached_avatar()."""
+    key = AVATAR_CACHE_KEY.format(user_id=user_id)
+    value = await cache.aget(key)
+    if value is None:
+        value = _avatar_row(await Profile.objects.filter(user_id=user_id).values_list(
+            'profile_picture', 'has_thumbnails',
+        ).afirst())
+        await cache.aset(key, value, AVATAR_CACHE_TIMEOUT)
+    return Avatar(*value) if value[0] else None
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_cached_avatar(sender, instance, **kwargs):
+    cache.delete(AVATAR_CACHE_KEY.format(user_id=instance.user_id))
+
+
+# Auto-create the profile. Nothing else about a User save touches it,
+# so there is no receiver re-saving it (every login saves the user).
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def create_user_profile(sender, instance, created, **kwargs):
+    if created:
+        # Letter avatar from the first name, then last name, then username.
+        initial = instance.first_name or instance.last_name or instance.username or 'U'
+        Profile.objects.create(user=instance, profile_picture=letter_avatar(initial))
\ No newline at end of file
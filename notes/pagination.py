@@ -0,0 +1,78 @@
+"""Keyset pagination for note listings.
+
+Pages are ordered by ``(-updated_at, -id)`` and a cursor records the last
+row of the previous page, so fetching page N costs the same as page 1 and
+rows never shift between pages the way they do with OFFSET.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 30
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(note):
+    raw = f'{note.updated_at.isoformat()}|{note.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        updated_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(updated_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def page_queryset(queryset, cursor=None):
+    """Order `queryset` for paging and skip everything up to `cursor`."""
+    queryset = queryset.order_by('-updated_at', '-id')
+    if cursor:
+        updated_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=pk)
+        )
+    return queryset
+
+
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Return the page of `queryset` that starts right after `cursor`."""
+    rows = list(page_queryset(queryset, cursor)[:page_size + 1])
+    return _page(rows, page_size)
+
+
+async def apaginate(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Async version of paginate()."""
+    rows = [row async for row in page_queryset(queryset, cursor)[:page_size + 1]]
+    return _page(rows, page_size)
+
+
+def _page(rows, page_size):
+    # One row past the page was fetched to tell whether there is a next one.
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return CursorPage(rows, encode_cursor(rows[-1]))
+    return CursorPage(rows)
@@ -0,0 +1,257 @@
+"""Revision history of notes, stored as snapshots and line deltas.
+
+Every save that changes a note appends a NoteRevision holding its new
+state. Most revisions are a delta against the previous one: a JSON list in
+which a positive int copies that many lines of the previous content, a
+negative int skips that many, and a string is inserted as is. A delta's
+size follows the size of the change, not of the note.
+
+A revision is stored whole (a snapshot) when it is the note's first, when
+MAX_DEPTH deltas have piled up since the last snapshot, or when those
+deltas add up to more than the content itself. Rebuilding any revision
+therefore reads one snapshot and at most MAX_DEPTH deltas. The data they
+hold is at most about twice the size of the note. Snapshots cost no more
+than the deltas they follow, so total storage stays within a small factor
+of the edits made.
+
+Diffing is the slow part of recording. diff() only matches lines between
+the first and last changed ones, and gives up matching once that stretch
+exceeds DIFF_BUDGET line pairs; callers diff with prepare() before taking
+the write lock and hand the result to record().
+
+prune() thins out old history (see prune_revisions) and re-encodes what
+it keeps in place, since dropping a revision breaks the deltas after it.
+"""
+import hashlib
+import json
+from difflib import SequenceMatcher
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .compression import text
+from .models import NoteRevision
+
+MAX_DEPTH = 50
+
+# Above this many line pairs between the first and last changed lines,
+# diff() replaces the whole stretch instead of matching lines in it.
+DIFF_BUDGET = 1_000_000
+
+# Revisions older than `age` are kept at most one per `spacing`; older than
+# REVISION_RETENTION_DAYS they are dropped.
+THINNING = (
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=7), timedelta(days=1)),
+)
+
+
+def checksum(content):
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+
+def diff(old, new):
+    """Delta turning `old` into `new`."""
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    # Lines shared at either end are cheap to find; SequenceMatcher, whose
+    # time grows with the product of the lengths, only sees the rest.
+    shortest = min(len(a), len(b))
+    head = 0
+    while head < shortest and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < shortest - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    a, b = a[head:len(a) - tail], b[head:len(b) - tail]
+    if len(a) * len(b) > DIFF_BUDGET:
+        opcodes = [('replace', 0, len(a), 0, len(b))]
+    else:
+        opcodes = SequenceMatcher(None, a, b).get_opcodes()
+    ops = [head] if head else []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    if tail:
+        ops.append(tail)
+    return ops
+
+
+def patch(old, ops):
+    lines = old.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(lines[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return ''.join(out)
+
+
+def _revision(note_id, title, content, previous, previous_content, created_at):
+    """An unsaved NoteRevision for this state, following `previous`, whose
+    content is `previous_content`."""
+    revision = NoteRevision(
+        note_id=note_id,
+        title=title,
+        content_length=len(content),
+        checksum=checksum(content),
+        created_at=created_at,
+    )
+    if previous is not None:
+        delta = json.dumps(diff(previous_content, content), separators=(',', ':'))
+        chain_size = previous.chain_size + len(delta)
+        if previous.depth < MAX_DEPTH and chain_size <= len(content):
+            revision.data = delta
+            revision.depth = previous.depth + 1
+            revision.chain_size = chain_size
+            return revision
+    revision.is_snapshot = True
+    revision.data = content
+    return revision
+
+
+def prepare(note_id, state, previous=None):
+    """The unsaved revisions that record() would add for the note's new
+    `state` (title, content), and what they depend on. Call it before the
+    write transaction, so the diff is not made while holding the lock."""
+    latest = NoteRevision.objects.filter(note_id=note_id).order_by('-id').first()
+    key = (latest and latest.id, state, previous)
+    title, content = state
+    now = timezone.now()
+    if previous is None:
+        return key, [_revision(note_id, title, content, None, None, now)]
+    if previous == state:
+        return key, []
+    new = []
+    old_title, old_content = previous
+    if latest is None or latest.checksum != checksum(old_content):
+        # History missing or out of step; start over from the old state.
+        latest = _revision(note_id, old_title, old_content, None, None, now)
+        new.append(latest)
+    new.append(_revision(note_id, title, content, latest, old_content, now))
+    return key, new
+
+
+def record(note, previous=None, prepared=None):
+    """Add `note`'s current state to its history; call after saving it.
+
+    `previous` is the (title, content) the note had before this save, if
+    it existed. It lets the first revision of a note saved before history
+    was kept start from its old state. `prepared` is what prepare() gave
+    for this save; it is diffed again if the note or its history moved on
+    since. Returns the new revision, or None if nothing changed.
+    """
+    state = (note.title, note.content)
+    if prepared is not None:
+        latest = note.revisions.order_by('-id').values_list('id', flat=True).first()
+        if prepared[0] != (latest, state, previous):
+            prepared = None
+    if prepared is None:
+        prepared = prepare(note.pk, state, previous)
+    new = prepared[1]
+    for revision in new:
+        revision.save()
+    return new[-1] if new else None
+
+
+def content_of(revision):
+    """Rebuild the content `revision` holds."""
+    if revision.is_snapshot:
+        return revision.data
+    chain = list(
+        NoteRevision.objects.filter(
+            note_id=revision.note_id,
+            id__lte=revision.id,
+            id__gte=NoteRevision.objects.filter(
+                note_id=revision.note_id, id__lte=revision.id, is_snapshot=True,
+            ).order_by('-id').values('id')[:1],
+        ).order_by('id').values_list('data', flat=True)
+    )
+    content = text(chain[0])
+    for data in chain[1:]:
+        content = patch(content, json.loads(text(data)))
+    return content
+
+
+def restore(note, revision):
+    """Put `revision`'s state back into `note` and record that as a new
+    revision, so a restore can itself be undone."""
+    previous = (note.title, note.content)
+    note.title = revision.title
+    note.content = content_of(revision)
+    prepared = prepare(note.pk, (note.title, note.content), previous)
+    with transaction.atomic():
+        note.save()
+        record(note, previous, prepared)
+
+
+def _kept(revisions, now):
+    """The revisions the retention policy keeps, oldest first."""
+    retention = timedelta(days=settings.REVISION_RETENTION_DAYS)
+    kept = []
+    buckets = set()
+    # Newest first, so each bucket keeps its latest revision.
+    for index, revision in enumerate(reversed(revisions)):
+        age = now - revision.created_at
+        if index == 0:
+            kept.append(revision)  # the note's current state
+            continue
+        if age > retention:
+            break
+        for tier_age, spacing in reversed(THINNING):
+            if age > tier_age:
+                bucket = (spacing, revision.created_at.timestamp() // spacing.total_seconds())
+                if bucket not in buckets:
+                    buckets.add(bucket)
+                    kept.append(revision)
+                break
+        else:
+            kept.append(revision)
+    return kept[::-1]
+
+
+def prune(note_id, now=None):
+    """Thin out `note_id`'s history; returns the number of revisions dropped."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        revisions = list(NoteRevision.objects.filter(note_id=note_id).order_by('id'))
+        kept = _kept(revisions, now)
+        if len(kept) == len(revisions):
+            return 0
+        kept_ids = {revision.id for revision in kept}
+        contents = {}
+        content = None
+        for revision in revisions:
+            content = revision.data if revision.is_snapshot else patch(content, json.loads(revision.data))
+            if revision.id in kept_ids:
+                contents[revision.id] = content
+        # Re-encode the kept revisions in place, so their ids (and links to
+        # them) survive; only the dropped rows are deleted.
+        fields = ('data', 'is_snapshot', 'depth', 'chain_size')
+        changed = []
+        previous = previous_content = None
+        for revision in kept:
+            content = contents[revision.id]
+            encoded = _revision(
+                note_id, revision.title, content, previous, previous_content, revision.created_at,
+            )
+            if any(getattr(encoded, field) != getattr(revision, field) for field in fields):
+                for field in fields:
+                    setattr(revision, field, getattr(encoded, field))
+                changed.append(revision)
+            previous, previous_content = revision, content
+        NoteRevision.objects.filter(note_id=note_id).exclude(id__in=kept_ids).delete()
+        NoteRevision.objects.bulk_update(changed, fields)
+    return len(revisions) - len(kept)
@@ -0,0 +1,131 @@
+"""Send the listing pages' reads to the replica, everything else to the primary.
+
+Views wrapped in @read_from_replica read from the ``replica`` database for
+GET and HEAD requests when one is configured. Writes always go to the
+primary, and so do a user's reads for REPLICA_PIN_SECONDS after a request
+of theirs wrote to it, so the page they are sent to after a change never
+misses it because the replica lags.
+
+ReplicaPinMiddleware notes the writes as the router hands them out and
+marks such a response with a signed cookie that expires after
+REPLICA_PIN_SECONDS. The cookie travels with the user's next request
+whichever worker serves it; nothing is kept on the server.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+REPLICA = 'replica'
+
+PIN_COOKIE = 'replica_pin'
+
+_use_replica = ContextVar('use_replica', default=False)
+# The models written during the current request, set by the middleware.
+_writes = ContextVar('replica_writes', default=None)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA in connections:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes.append(model)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema by replicating the primary.
+        return db != REPLICA
+
+
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = []
+        token = _writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes:
+            _pin(request, response, request.user)
+        return response
+
+    async def __acall__(self, request):
+        writes = []
+        token = _writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes:
+            _pin(request, response, await request.auser())
+        return response
+
+
+def _pin(request, response, user):
+    if user.is_authenticated and REPLICA in connections and settings.REPLICA_PIN_SECONDS > 0:
+        response.set_signed_cookie(
+            PIN_COOKIE, str(user.pk), salt=PIN_COOKIE, max_age=settings.REPLICA_PIN_SECONDS,
+            secure=request.is_secure(), httponly=True, samesite='Lax',
+        )
+
+
+def _pinned(request, user):
+    try:
+        value = request.get_signed_cookie(
+            PIN_COOKIE, salt=PIN_COOKIE, max_age=settings.REPLICA_PIN_SECONDS,
+        )
+    except (KeyError, signing.BadSignature):
+        return False
+    return value == str(user.pk)
+
+
+def read_from_replica(view):
+    """Let `view` read from the replica, unless the request can change
+    data or the user changed something within REPLICA_PIN_SECONDS."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or REPLICA not in connections:
+                return await view(request, *args, **kwargs)
+            if _pinned(request, await request.auser()):
+                return await view(request, *args, **kwargs)
+            token = _use_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or REPLICA not in connections:
+            return view(request, *args, **kwargs)
+        if _pinned(request, request.user):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
@@ -0,0 +1,251 @@
+"""Full-text search over notes.
+
+On SQLite the index is an FTS5 table (``notes_note_fts``) that triggers
+keep in step with ``notes_note``. It is an external-content table: it
+holds only the index, and reads the text it needs for snippets through a
+view that inflates compressed bodies with notes_text() (see
+compression.py), so no body is stored a second time, uncompressed. On
+PostgreSQL a GIN index over a tsvector expression is used instead. Both
+return notes ranked by relevance with a ``snippet`` attribute whose
+matches are wrapped in HIGHLIGHT_START/END.
+
+SQLite cannot rebuild a table that a view refers to, which migrations
+altering ``notes_note`` do, so the view is dropped before every migrate
+and created again after it, along with the triggers the rebuild drops
+(see NotesConfig.ready).
+"""
+import re
+
+from django.db import connections, transaction
+
+FTS_TABLE = 'notes_note_fts'
+FTS_VIEW = 'notes_note_fts_text'
+PG_INDEX = 'note_search_gin'
+PG_CONFIG = 'simple'
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TERM_RE = re.compile(r'\w+')
+
+SQLITE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content,
+        content = '{FTS_VIEW}', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+SQLITE_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS {FTS_VIEW} AS
+    SELECT id, title, notes_text(content) AS content FROM notes_note
+"""
+
+# An external-content index is told the old values to remove them.
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes_note BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.id, new.title, notes_text(new.content));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON notes_note BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, notes_text(old.content));
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.id, new.title, notes_text(new.content));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes_note BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, notes_text(old.content));
+    END
+    """,
+]
+
+# The index as migrations 0005-0015 built it: a table holding its own copy
+# of every body. Kept for those migrations and for reversing 0016.
+LEGACY_SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes_note BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.id, new.title, notes_text(new.content));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON notes_note BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title, content = notes_text(new.content)
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes_note BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_TEARDOWN = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+    f'DROP VIEW IF EXISTS {FTS_VIEW}',
+]
+
+
+def search_terms(q):
+    return _TERM_RE.findall(q)
+
+
+def search_notes(queryset, q):
+    """Filter `queryset` down to notes matching `q`, best matches first.
+
+    Every term is prefix-matched and all terms must match.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(queryset, terms)
+    return _sqlite_search(queryset, terms)
+
+
+def _sqlite_search(queryset, terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = notes_note.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={
+            'rank': f'bm25({FTS_TABLE}, 10.0, 1.0)',
+            'snippet': (
+                f"snippet({FTS_TABLE}, -1, char(2), char(3), '…', 24)"
+            ),
+        },
+    ).order_by('rank', '-updated_at')
+
+
+def _search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector('title', 'content', config=PG_CONFIG)
+
+
+def _postgres_search(queryset, terms):
+    from django.contrib.postgres.search import (
+        SearchHeadline, SearchQuery, SearchRank,
+    )
+
+    query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        search_type='raw',
+        config=PG_CONFIG,
+    )
+    return queryset.annotate(
+        search=_search_vector(),
+    ).filter(search=query).annotate(
+        rank=SearchRank(_search_vector(), query),
+        snippet=SearchHeadline(
+            'content', query,
+            config=PG_CONFIG,
+            start_sel=HIGHLIGHT_START,
+            stop_sel=HIGHLIGHT_END,
+            max_words=24,
+        ),
+    ).order_by('-rank', '-updated_at')
+
+
+def install(schema_editor):
+    """Create and fill the search index for the connection behind
+    `schema_editor`. On SQLite the view is left to ensure_schema(), which
+    runs after the migration."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_TABLE)
+        for sql in SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, content) '
+            f'SELECT id, title, notes_text(content) FROM notes_note'
+        )
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+
+        from .models import Note
+
+        schema_editor.add_index(Note, GinIndex(_search_vector(), name=PG_INDEX))
+
+
+def drop_view(using='default', **kwargs):
+    """pre_migrate receiver: drop the view so migrations can rebuild
+    ``notes_note``."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP VIEW IF EXISTS {FTS_VIEW}')
+
+
+def ensure_schema(using='default', **kwargs):
+    """post_migrate receiver: recreate the view and any missing triggers.
+
+    SQLite rebuilds a table to alter it, which silently drops its triggers.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        row = cursor.fetchone()
+        if row is None:
+            return
+        if FTS_VIEW not in row[0]:
+            # Migrated back to before 0016.
+            for sql in LEGACY_SQLITE_SCHEMA[1:]:
+                cursor.execute(sql)
+            return
+        cursor.execute(SQLITE_VIEW)
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_TEARDOWN:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def rebuild_index(using='default'):
+    """Repopulate the SQLite FTS index from ``notes_note``.
+
+    Returns the number of indexed notes. PostgreSQL indexes are maintained
+    by the database itself, so this is a REINDEX there.
+    """
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+            cursor.execute('SELECT COUNT(*) FROM notes_note')
+            return cursor.fetchone()[0]
+        cursor.execute(SQLITE_TABLE)
+        cursor.execute(SQLITE_VIEW)
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+        # 'rebuild' reads every row back through the view.
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute('SELECT COUNT(*) FROM notes_note')
+        return cursor.fetchone()[0]
@@ -0,0 +1,81 @@
+"""Delta sync: the notes a client changed since its last sync.
+
+Every change to a user's notes takes the next number of that user's change
+sequence (ChangeCounter) and stamps it on the note's ``change_seq``; a
+hard delete leaves a NoteTombstone with it instead. A client keeps the
+cursor of its last sync and asks for everything after it.
+
+Numbers are handed out under the counter's row lock, so they commit in
+order. A sync reads the counter first and only returns changes up to that
+value: everything at or below it has committed, so the cursor it hands
+back never skips a change that commits later. Notes changed by one UPDATE
+share a number, so pages are keyed on ``(change_seq, id)``. A cursor
+reading ``seq.id`` is partway through a page run; a bare ``seq`` means
+everything up to it was sent, and if the counter has not moved since, the
+sync costs one primary-key lookup.
+"""
+from django.db.models import Q
+
+from .models import ChangeCounter, Note, NoteTombstone
+from .pagination import InvalidCursor
+
+PAGE_SIZE = 100
+
+# Fields sent for each changed note.
+NOTE_FIELDS = (
+    'id', 'title', 'content', 'archived', 'trashed', 'version', 'created_at', 'updated_at',
+)
+
+
+def encode_cursor(seq, note_id=None):
+    return f'{seq}' if note_id is None else f'{seq}.{note_id}'
+
+
+def decode_cursor(cursor):
+    """(seq, note_id or None) from a cursor."""
+    try:
+        seq, _, note_id = cursor.partition('.')
+        return int(seq), int(note_id) if note_id else None
+    except ValueError as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _after(queryset, id_field, after):
+    if after is None:
+        return queryset
+    seq, note_id = after
+    if note_id is None:
+        return queryset.filter(change_seq__gt=seq)
+    return queryset.filter(Q(change_seq__gt=seq) | Q(change_seq=seq, **{f'{id_field}__gt': note_id}))
+
+
+def changes(user_id, cursor=None, limit=PAGE_SIZE):
+    """The page of `user_id`'s changes after `cursor` (from the start if
+    None), as a dict ready for JSON."""
+    after = decode_cursor(cursor) if cursor else None
+    head = ChangeCounter.objects.filter(user_id=user_id).values_list('value', flat=True).first() or 0
+    if after and after[1] is None and after[0] >= head:
+        return {'notes': [], 'deleted': [], 'cursor': encode_cursor(after[0]), 'more': False}
+
+    notes = _after(
+        Note.objects.filter(user_id=user_id, change_seq__lte=head), 'id', after,
+    ).order_by('change_seq', 'id').only(*NOTE_FIELDS, 'change_seq')[:limit + 1]
+    deleted = _after(
+        NoteTombstone.objects.filter(user_id=user_id, change_seq__lte=head), 'note_id', after,
+    ).order_by('change_seq', 'note_id').values_list('change_seq', 'note_id')[:limit + 1]
+    # (seq, id, note or None for a deletion); no two share (seq, id).
+    entries = sorted(
+        [(note.change_seq, note.id, note) for note in notes]
+        + [(seq, note_id, None) for seq, note_id in deleted]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        'notes': [
+            {field: getattr(note, field) for field in NOTE_FIELDS}
+            for _, _, note in entries if note is not None
+        ],
+        'deleted': [note_id for _, note_id, note in entries if note is None],
+        'cursor': encode_cursor(*entries[-1][:2]) if more else encode_cursor(head),
+        'more': more,
+    }
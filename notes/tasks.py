@@ -0,0 +1,26 @@
+"""Work run through the job queue (see jobs.py)."""
+from django.contrib.auth.models import User
+
+from . import images, listcache
+from .jobs import register
+from .models import Note
+
+
+@register('empty_trash')
+def empty_trash(user_id):
+    deleted = Note.objects.filter(user_id=user_id, trashed=True).delete_in_batches()
+    listcache.bump_generation(user_id)
+    return {'deleted': deleted}
+
+
+@register('delete_user')
+def delete_user(user_id):
+    # Delete the notes in batches first, so the cascade left is small.
+    deleted = Note.objects.filter(user_id=user_id).delete_in_batches()
+    User.objects.filter(pk=user_id).delete()
+    return {'deleted_notes': deleted}
+
+
+@register('make_thumbnails')
+def make_thumbnails(profile_id, name):
+    return {'made': images.make_thumbnails(profile_id, name)}
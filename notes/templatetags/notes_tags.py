@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from notes.images import variant_size
+from notes.search import HIGHLIGHT_END, HIGHLIGHT_START
+
+register = template.Library()
+
+
+@register.filter
+def highlight(snippet):
+    """Render a search snippet with its matches wrapped in <mark>."""
+    html = escape(snippet or '')
+    html = html.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    return mark_safe(html)
+
+
+@register.simple_tag
+def avatar_img(avatar, size, css_class='', alt='Avatar'):
+    """Show `avatar` at `size` CSS pixels.
+
+    Once its renditions exist, the smallest ones covering 1x and 2x
+    screens are offered as WebP with a JPEG fallback; until then the
+    original is used.
+    """
+    if not avatar.has_thumbnails:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" width="{}" height="{}">',
+            avatar.url, alt, css_class, size, size,
+        )
+    one, two = variant_size(size), variant_size(size * 2)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{} 1x, {} 2x">'
+        '<img src="{}" srcset="{} 1x, {} 2x" alt="{}" class="{}" width="{}" height="{}">'
+        '</picture>',
+        avatar.variant_url(one, 'webp'), avatar.variant_url(two, 'webp'),
+        avatar.variant_url(one, 'jpg'),
+        avatar.variant_url(one, 'jpg'), avatar.variant_url(two, 'jpg'),
+        alt, css_class, size, size,
+    )
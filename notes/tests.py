@@ -1,7 +1,44 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Note
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import os
+import re
+import signal
+from io import BytesIO, StringIO
+from pathlib import Path
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from PIL import Image
+from . import async_views, jobs, listcache
+from .avatars import LETTER_AVATARS, letter_avatar, avatar_storage, is_content_name, variant_name
+from .images import AVATAR_SIZES, FORMATS
+from .instrumentation import RequestTiming, _current
+from .jobs import claim, enqueue, register, requeue_stale, run_job
+from .models import PREVIEW_LENGTH, Job, Note, NoteRevision, Profile
+from .pagination import PAGE_SIZE, encode_cursor, page_queryset
+from . import revisions, transfer
+from .routers import PIN_COOKIE, REPLICA
+from .search import FTS_TABLE, search_notes
+from .urls import build_urlpatterns
+
+# Lets AsyncViewTests route the read pages to async_views.
+urlpatterns = build_urlpatterns(async_views)
 
 
 class UserAuthenticationTests(TestCase):
@@ -57,6 +94,58 @@ class UserAuthenticationTests(TestCase):
         })
         self.assertIn(response.status_code, [200, 302])
     
+    def signup(self):
+        return self.client.post(reverse('signup'), {
+            'username': self.username,
+            'password': self.password,
+            'password2': self.password,
+            'first_name': 'Test',
+            'last_name': 'User'
+        })
+
+    def writes(self, queries):
+        # Session writes aside; those belong to login() whatever else happens.
+        statements = (re.match(r'(INSERT INTO|UPDATE|DELETE FROM) "\w+"', q['sql']) for q in queries)
+        return [match[0] for match in statements if match and 'django_session' not in match[0]]
+
+    def count_hashes(self):
+        encode = PBKDF2PasswordHasher.encode
+        calls = []
+
+        def counting(hasher, *args, **kwargs):
+            calls.append(args)
+            return encode(hasher, *args, **kwargs)
+        return calls, patch.object(PBKDF2PasswordHasher, 'encode', autospec=True, side_effect=counting)
+
+    def test_signup_writes_user_profile_and_last_login_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.signup()
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertEqual(self.writes(queries), [
+            'INSERT INTO "auth_user"', 'INSERT INTO "notes_profile"', 'UPDATE "auth_user"',
+        ])
+        user = User.objects.get(username=self.username)
+        self.assertEqual((user.first_name, user.last_name), ('Test', 'User'))
+        # The letter avatar comes from the first name, set before the INSERT.
+        self.assertEqual(user.profile.profile_picture.name, letter_avatar('T'))
+
+    def test_login_does_not_write_profile(self):
+        User.objects.create_user(username=self.username, password=self.password)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {'username': self.username, 'password': self.password})
+        self.assertEqual(self.writes(queries), ['UPDATE "auth_user"'])
+
+    def test_signup_and_login_hash_the_password_once(self):
+        calls, patcher = self.count_hashes()
+        with patcher:
+            self.signup()
+        self.assertEqual(len(calls), 1)
+        self.client.logout()
+        calls, patcher = self.count_hashes()
+        with patcher:
+            self.client.post(reverse('login'), {'username': self.username, 'password': self.password})
+        self.assertEqual(len(calls), 1)
+
     def test_logout(self):
         user = User.objects.create_user(username=self.username, password=self.password)
         self.client.login(username=self.username, password=self.password)
@@ -64,11 +153,72 @@ class UserAuthenticationTests(TestCase):
         self.assertNotIn('_auth_user_id', self.client.session)
 
 
+SESSION_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'notes'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+}
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def session_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries if 'django_session' in q['sql']]
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                       CACHES=SESSION_CACHES, SESSION_CACHE_ALIAS='sessions')
+    def test_cached_db_reads_sessions_from_the_cache(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.session_queries(self.client, reverse('sync_notes')), [])
+        self.assertEqual(Session.objects.count(), 1)
+        self.client.post(reverse('logout'))
+        self.assertEqual(self.client.get(reverse('sync_notes')).status_code, 302)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions_need_no_storage(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.session_queries(self.client, reverse('notes')), [])
+        self.assertFalse(Session.objects.exists())
+        self.client.cookies['sessionid'] = 'tampered'
+        self.assertEqual(self.client.get(reverse('notes')).status_code, 302)
+
+    def test_purge_sessions_deletes_expired_rows_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1))
+             for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = StringIO()
+        call_command('purge_sessions', '--dry-run', stdout=out)
+        self.assertIn('Would purge 5 sessions', out.getvalue())
+        out = StringIO()
+        call_command('purge_sessions', '--batch-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn('Purged 5 sessions', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+    def test_bench_sessions_command(self):
+        out = StringIO()
+        call_command('bench_sessions', '--user', 'testuser', '--iterations', '2', '--warmup', '0',
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        for mode in ('db', 'cached_db+file', 'cached_db+locmem', 'signed_cookies'):
+            self.assertTrue(any(line.startswith(mode + ' ') for line in lines), mode)
+        db = next(line for line in lines if line.startswith('db '))
+        self.assertTrue(db.endswith('1.0'))
+        self.assertFalse(Session.objects.exists())
+
+
 class NotesCRUDTests(TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        cache.clear()
     
     def test_create_note(self):
         self.client.post(reverse('notes'), {
@@ -94,7 +244,7 @@ class NotesCRUDTests(TestCase):
         
         response = self.client.get(reverse('notes'))
         notes = response.context['notes']
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
         self.assertEqual(notes[0].title, 'My Note')
     
     def test_edit_note(self):
@@ -131,6 +281,7 @@ class ArchiveTests(TestCase):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        cache.clear()
     
     def test_archive_note(self):
         note = Note.objects.create(user=self.user, title='To Archive', content='Content')
@@ -151,7 +302,7 @@ class ArchiveTests(TestCase):
         response = self.client.get(reverse('notes'))
         notes = response.context['notes']
         
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
         self.assertEqual(notes[0].title, 'Active')
     
     def test_view_archived_notes(self):
@@ -162,7 +313,7 @@ class ArchiveTests(TestCase):
         response = self.client.get(reverse('archive'))
         notes = response.context['notes']
         
-        self.assertEqual(notes.count(), 2)
+        self.assertEqual(len(notes), 2)
         for note in notes:
             self.assertTrue(note.archived)
 
@@ -172,6 +323,7 @@ class TrashTests(TestCase):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        cache.clear()
     
     def test_trash_note(self):
         note = Note.objects.create(user=self.user, title='To Trash', content='Content')
@@ -199,22 +351,528 @@ class TrashTests(TestCase):
         response = self.client.get(reverse('trash'))
         notes = response.context['notes']
         
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
         self.assertEqual(notes[0].title, 'Trashed')
+
+    @override_settings(TRASH_RETENTION_DAYS=30)
+    def test_empty_trash_page_shows_retention(self):
+        self.assertContains(self.client.get(reverse('trash')), 'appear here for 30 days')
     
     def test_empty_trash(self):
         Note.objects.create(user=self.user, title='Trashed 1', content='Content', trashed=True)
         Note.objects.create(user=self.user, title='Trashed 2', content='Content', trashed=True)
         
-        self.client.post(reverse('empty_trash'))
+        with self.settings(JOBS_MODE='eager'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('empty_trash'))
         self.assertEqual(Note.objects.filter(user=self.user, trashed=True).count(), 0)
 
+    def test_trashed_at_is_set_and_cleared(self):
+        note = Note.objects.create(user=self.user, title='Note', content='Content')
+        self.client.get(reverse('trash_note', args=[note.id]))
+        note.refresh_from_db()
+        self.assertIsNotNone(note.trashed_at)
+        self.client.get(reverse('restore_note', args=[note.id]))
+        note.refresh_from_db()
+        self.assertIsNone(note.trashed_at)
+
+    def test_purge_trash(self):
+        old = timezone.now() - timedelta(days=8)
+        recent = timezone.now() - timedelta(days=6)
+        for i in range(5):
+            Note.objects.create(user=self.user, title=f'Old {i}', content='x', trashed=True, trashed_at=old)
+        Note.objects.create(user=self.user, title='Recent', content='x', trashed=True, trashed_at=recent)
+        Note.objects.create(user=self.user, title='Active', content='x')
+        self.client.get(reverse('trash'))
+        out = StringIO()
+        call_command('purge_trash', '--batch-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn('Purged 5 notes', out.getvalue())
+        self.assertEqual(sorted(Note.objects.values_list('title', flat=True)), ['Active', 'Recent'])
+        response = self.client.get(reverse('trash'))
+        self.assertEqual([n.title for n in response.context['notes']], ['Recent'])
+        self.assertContains(response, 'after 7 days')
+
+    def test_purge_trash_skips_id_gaps(self):
+        old = timezone.now() - timedelta(days=8)
+        for note_id in (None, 1_000_000, None):
+            Note.objects.create(id=note_id, user=self.user, title='Old', content='x', trashed=True, trashed_at=old)
+        with patch('notes.management.commands.purge_trash.time.sleep') as sleep:
+            call_command('purge_trash', '--batch-size', '2', stdout=StringIO())
+        self.assertFalse(Note.objects.exists())
+        # One pause per batch that deleted something, none for the gap.
+        self.assertEqual(sleep.call_count, 2)
+
+
+class RevisionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.content = ''.join(f'Line {i} of a long note.\n' for i in range(500))
+
+    def edit(self, note, content, title='Note'):
+        self.client.post(reverse('edit_note', args=[note.id]), {'title': title, 'content': content})
+
+    def test_edits_are_stored_as_small_deltas(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': self.content})
+        note = Note.objects.get()
+        edited = self.content.replace('Line 250 ', 'Line two hundred and fifty ')
+        self.edit(note, edited)
+        first, second = note.revisions.order_by('id')
+        self.assertTrue(first.is_snapshot)
+        self.assertFalse(second.is_snapshot)
+        self.assertLess(len(second.data), 100)
+        self.assertEqual(revisions.content_of(first), self.content)
+        self.assertEqual(revisions.content_of(second), edited)
+
+    def test_unchanged_save_adds_nothing(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': 'x'})
+        note = Note.objects.get()
+        self.edit(note, 'x')
+        self.assertEqual(note.revisions.count(), 1)
+
+    def test_note_without_history_keeps_its_old_state(self):
+        note = Note.objects.create(user=self.user, title='Note', content='Original')
+        self.edit(note, 'Overwritten')
+        self.assertEqual(
+            [revisions.content_of(r) for r in note.revisions.order_by('id')],
+            ['Original', 'Overwritten'],
+        )
+
+    def test_reconstruction_is_bounded(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': self.content})
+        note = Note.objects.get()
+        versions = [self.content]
+        with patch('notes.revisions.MAX_DEPTH', 3):
+            for i in range(10):
+                versions.append(versions[-1] + f'Appended {i}\n')
+                self.edit(note, versions[-1])
+        history = list(note.revisions.order_by('id'))
+        self.assertEqual([r.depth for r in history], [0, 1, 2, 3] * 2 + [0, 1, 2])
+        self.assertEqual([revisions.content_of(r) for r in history], versions)
+
+    def test_rewrite_becomes_snapshot(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': 'short'})
+        note = Note.objects.get()
+        self.edit(note, 'completely different')
+        self.assertTrue(note.revisions.order_by('id').last().is_snapshot)
+
+    def test_diff_cost_is_bounded(self):
+        content = 'The same line.\n' * 20000
+        edited = content.replace('The same', 'A changed', 1)
+        ops = revisions.diff(content, edited)
+        self.assertEqual(ops, [-1, 'A changed line.\n', 19999])
+
+        lines = self.content.splitlines(keepends=True)
+        lines[100] = lines[200] = 'Changed.\n'
+        edited = ''.join(lines)
+        with patch('notes.revisions.DIFF_BUDGET', 100):
+            ops = revisions.diff(self.content, edited)
+        # Too many lines between the changes to match; replaced whole.
+        self.assertEqual(ops, [100, -101, ''.join(lines[100:201]), 299])
+        self.assertEqual(revisions.patch(self.content, ops), edited)
+
+    def test_stale_prepared_revision_is_diffed_again(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': 'One\n'})
+        note = Note.objects.get()
+        prepared = revisions.prepare(note.pk, ('Note', 'One\nTwo\n'), ('Note', 'One\n'))
+        self.edit(note, 'Zero\nOne\n')
+        previous = ('Note', 'Zero\nOne\n')
+        note.content = 'One\nTwo\n'
+        note.save()
+        revisions.record(note, previous, prepared)
+        self.assertEqual(
+            [revisions.content_of(r) for r in note.revisions.order_by('id')],
+            ['One\n', 'Zero\nOne\n', 'One\nTwo\n'],
+        )
+
+    def test_history_pages_and_restore(self):
+        self.client.post(reverse('notes'), {'title': 'Draft', 'content': 'First version'})
+        note = Note.objects.get()
+        self.edit(note, 'Second version', title='Final')
+        first = note.revisions.order_by('id').first()
+        response = self.client.get(reverse('note_revisions', args=[note.id]))
+        self.assertContains(response, reverse('note_revision', args=[note.id, first.id]))
+        response = self.client.get(reverse('note_revision', args=[note.id, first.id]))
+        self.assertContains(response, 'First version')
+
+        response = self.client.post(reverse('note_revision', args=[note.id, first.id]))
+        self.assertRedirects(response, reverse('edit_note', args=[note.id]))
+        note.refresh_from_db()
+        self.assertEqual((note.title, note.content), ('Draft', 'First version'))
+        self.assertEqual(note.revisions.count(), 3)
+
+        self.client.force_login(User.objects.create_user(username='other'))
+        for url in (reverse('note_revisions', args=[note.id]),
+                    reverse('note_revision', args=[note.id, first.id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_prune_thins_old_history(self):
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': self.content})
+        note = Note.objects.get()
+        versions = [self.content]
+        for i in range(12):
+            versions.append(versions[-1] + f'Appended {i}\n')
+            self.edit(note, versions[-1])
+        # Midday, so the day and hour buckets below do not straddle midnight.
+        now = datetime(2026, 1, 10, 12, 30, tzinfo=dt_timezone.utc)
+        ages = [timedelta(days=200), timedelta(days=30, hours=1), timedelta(days=30),
+                timedelta(days=10, hours=2), timedelta(days=10, hours=1), timedelta(days=2),
+                timedelta(hours=30, minutes=10), timedelta(hours=30, minutes=5),
+                timedelta(hours=30), timedelta(hours=2), timedelta(hours=1), timedelta(0),
+                timedelta(0)]
+        history = list(note.revisions.order_by('id'))
+        for revision, age in zip(history, ages):
+            NoteRevision.objects.filter(pk=revision.pk).update(created_at=now - age)
+
+        self.assertEqual(revisions.prune(note.id, now), 5)
+        kept = [revisions.content_of(r) for r in note.revisions.order_by('id')]
+        # Dropped: past retention, the older of each same-day pair and two
+        # revisions from the same hour.
+        self.assertEqual(kept, [versions[i] for i in (2, 4, 5, 8, 9, 10, 11, 12)])
+        self.assertTrue(note.revisions.order_by('id').first().is_snapshot)
+        # Kept revisions keep their ids, so links to them still work.
+        self.assertEqual(
+            list(note.revisions.order_by('id').values_list('id', flat=True)),
+            [history[i].id for i in (2, 4, 5, 8, 9, 10, 11, 12)],
+        )
+        url = reverse('note_revision', args=[note.id, history[2].id])
+        self.assertContains(self.client.get(url), 'Appended 1')
+
+        # Seen from today, all but the current state are past retention.
+        out = StringIO()
+        call_command('prune_revisions', stdout=out)
+        self.assertIn('Dropped 7 revisions from 1 notes', out.getvalue())
+        self.assertEqual(revisions.content_of(note.revisions.get()), versions[-1])
+
+
+class AutosaveTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        self.client.post(reverse('notes'), {'title': 'Note', 'content': 'Hello world'})
+        self.note = Note.objects.get()
+
+    def autosave(self, note_id=None, **payload):
+        return self.client.post(
+            reverse('autosave_note', args=[note_id or self.note.id]),
+            json.dumps(payload), content_type='application/json',
+        )
+
+    def test_applies_changes_to_the_version(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.autosave(version=1, changes=[[6, 11, 'there'], [0, 0, '> ']])
+        self.assertEqual(response.json(), {'version': 2})
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, '> Hello there')
+        self.assertEqual(self.note.preview, '> Hello there')
+        self.assertEqual(self.note.version, 2)
+        self.assertEqual(revisions.content_of(self.note.revisions.latest('id')), '> Hello there')
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "notes_note"'))
+        self.assertNotIn('"title"', update)
+        self.assertNotIn('"archived"', update)
+
+    def test_title_only_and_unchanged(self):
+        self.assertEqual(self.autosave(version=1, title='Renamed').json(), {'version': 2})
+        self.assertEqual(self.autosave(version=2, title='Renamed', changes=[]).json(), {'version': 2})
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.title, self.note.content), ('Renamed', 'Hello world'))
+        self.assertEqual(self.note.revisions.count(), 2)
+
+    def test_counts_code_points(self):
+        self.autosave(version=1, changes=[[5, 5, ' \U0001F600']])
+        self.assertEqual(self.autosave(version=2, changes=[[8, 13, 'there']]).status_code, 200)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, 'Hello \U0001F600 there')
+
+    def test_stale_version_conflicts(self):
+        self.client.post(reverse('edit_note', args=[self.note.id]), {'title': 'Note', 'content': 'Edited'})
+        response = self.autosave(version=1, changes=[[0, 5, 'Bye']])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'version': 2, 'title': 'Note', 'content': 'Edited'})
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, 'Edited')
+
+    def test_stale_instance_save_moves_version(self):
+        stale = Note.objects.get()
+        self.autosave(version=1, changes=[[0, 5, 'Bye']])
+        stale.content = 'Overwritten'
+        stale.save()
+        self.assertEqual(stale.version, 3)
+
+    def test_rejects_invalid_requests(self):
+        for payload in ({'changes': []}, {'version': '1'}, {'version': 1, 'changes': [[0, 99, 'x']]},
+                        {'version': 1, 'changes': [[0, 1]]}, {'version': 1, 'title': 'x' * 201}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.autosave(**payload).status_code, 400)
+        self.assertEqual(self.client.get(reverse('autosave_note', args=[self.note.id])).status_code, 405)
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.content, self.note.version), ('Hello world', 1))
+
+    def test_other_users_note(self):
+        other = User.objects.create_user(username='other', password='otherpass')
+        note = Note.objects.create(user=other, title='Other', content='Private')
+        self.assertEqual(self.autosave(note.id, version=1, title='Hacked').status_code, 404)
+
+    def test_edit_page_carries_version(self):
+        response = self.client.get(reverse('edit_note', args=[self.note.id]))
+        self.assertContains(response, 'data-version="1"')
+        self.assertContains(response, reverse('autosave_note', args=[self.note.id]))
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        self.notes = [
+            Note.objects.create(user=self.user, title=f'Note {i}', content=f'Content {i}')
+            for i in range(3)
+        ]
+
+    def sync(self, cursor=None, **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        return self.client.get(reverse('sync_notes'), params)
+
+    def test_first_sync_sends_everything(self):
+        page = self.sync().json()
+        self.assertEqual([note['id'] for note in page['notes']], [note.id for note in self.notes])
+        self.assertEqual(page['notes'][0]['content'], 'Content 0')
+        self.assertEqual(page['deleted'], [])
+        self.assertEqual(page['cursor'], '3')
+        self.assertFalse(page['more'])
+
+    def test_sends_only_changes_since_cursor(self):
+        cursor = self.sync().json()['cursor']
+        self.client.get(reverse('archive_note', args=[self.notes[0].id]))
+        self.client.post(reverse('edit_note', args=[self.notes[2].id]), {'title': 'Edited', 'content': 'New'})
+        self.client.post(reverse('notes'), {'title': 'Added', 'content': 'Fresh'})
+        other = User.objects.create_user(username='other', password='otherpass')
+        Note.objects.create(user=other, title='Theirs', content='Private')
+        page = self.sync(cursor).json()
+        self.assertEqual([note['title'] for note in page['notes']], ['Note 0', 'Edited', 'Added'])
+        self.assertTrue(page['notes'][0]['archived'])
+        self.assertEqual(self.sync(page['cursor']).json()['notes'], [])
+
+    def test_hard_deletes_come_back_as_tombstones(self):
+        cursor = self.sync().json()['cursor']
+        self.client.post(reverse('bulk_action'), {'action': 'trash', 'ids': [n.id for n in self.notes]})
+        self.client.get(reverse('delete_forever', args=[self.notes[0].id]))
+        with self.settings(JOBS_MODE='eager'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('empty_trash'))
+        page = self.sync(cursor).json()
+        self.assertEqual(page['notes'], [])
+        self.assertEqual(page['deleted'], [note.id for note in self.notes])
+
+    def test_pages_split_a_shared_change(self):
+        cursor = self.sync().json()['cursor']
+        self.client.post(reverse('bulk_action'), {'action': 'archive', 'ids': [n.id for n in self.notes]})
+        Note.objects.filter(id=self.notes[1].id).delete_forever()
+        seen, deleted, more = [], [], True
+        while more:
+            page = self.sync(cursor, limit=1).json()
+            seen += [note['id'] for note in page['notes']]
+            deleted += page['deleted']
+            cursor, more = page['cursor'], page['more']
+        self.assertEqual(seen, [self.notes[0].id, self.notes[2].id])
+        self.assertEqual(deleted, [self.notes[1].id])
+        self.assertNotIn('.', cursor)
+
+    def test_up_to_date_sync_is_one_lookup(self):
+        cursor = self.sync().json()['cursor']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sync(cursor).json()['cursor'], cursor)
+        self.assertEqual(len([q for q in queries if 'notes_' in q['sql']]), 1)
+
+    def test_rejects_bad_cursor_and_limit(self):
+        for params in ({'cursor': 'abc'}, {'limit': 0}, {'limit': 501}, {'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.sync(**params).status_code, 400)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        Note.objects.create(user=self.user, title='Groceries', content='Milk\nEggs')
+        Note.objects.create(user=self.user, title='', content='x' * 5000, archived=True)
+        Note.objects.create(user=self.user, title='Old', content='Gone', trashed=True)
+        other = User.objects.create_user(username='other', password='otherpass')
+        Note.objects.create(user=other, title='Theirs', content='Private')
+
+    def export(self, export_format='ndjson'):
+        response = self.client.get(reverse('export_notes'), {'format': export_format})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('attachment; filename="notes-', response['Content-Disposition'])
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Groceries', '', 'Old'])
+        self.assertEqual(rows[1]['content'], 'x' * 5000)
+        self.assertTrue(rows[1]['archived'])
+        self.assertEqual(self.client.get(reverse('export_notes'), {'format': 'pdf'}).status_code, 400)
+
+    @patch('notes.transfer.STREAM_CHUNK_SIZE', 100)
+    async def test_export_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('export_notes'))
+        # Not a sync iterator that Django would read whole first.
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response]
+        self.assertGreater(len(chunks), 1)
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Groceries', '', 'Old'])
+
+    def test_export_markdown_zip(self):
+        response, body = self.export('markdown')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(BytesIO(body))
+        names = archive.namelist()
+        self.assertEqual([name.split('/')[0] for name in names], ['notes', 'archive', 'trash'])
+        self.assertTrue(names[0].startswith('notes/groceries-'))
+        self.assertEqual(archive.read(names[0]).decode(), '# Groceries\n\nMilk\nEggs\n')
+        self.assertEqual(archive.read(names[1]).decode(), 'x' * 5000 + '\n')
+
+    def test_import_round_trip(self):
+        _, body = self.export()
+        exported = [json.loads(line) for line in body.splitlines()]
+        newcomer = User.objects.create_user(username='newcomer', password='newpass')
+        self.client.force_login(newcomer)
+        cursor = self.client.get(reverse('sync_notes')).json()['cursor']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('import_notes'), {'file': SimpleUploadedFile('notes.ndjson', body)},
+                HTTP_ACCEPT='application/json',
+            )
+        self.assertEqual(response.json()['imported'], 3)
+        self.assertIn('notes_per_second', response.json())
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "notes_note"')]
+        self.assertEqual(len(inserts), 1)
+
+        notes = list(Note.objects.filter(user=newcomer).order_by('id'))
+        self.assertEqual([(n.title, n.content, n.archived, n.trashed) for n in notes],
+                         [(r['title'], r['content'], r['archived'], r['trashed']) for r in exported])
+        self.assertEqual(notes[0].created_at.isoformat()[:19], exported[0]['created_at'][:19])
+        self.assertEqual(notes[1].preview, 'x' * PREVIEW_LENGTH)
+        self.assertIsNotNone(notes[2].trashed_at)
+        self.assertEqual(len(self.client.get(reverse('sync_notes'), {'cursor': cursor}).json()['notes']), 3)
+        self.assertEqual(len(self.client.get(reverse('notes'), {'q': 'eggs'}).context['notes']), 1)
+
+    def test_import_in_batches_stops_at_bad_line(self):
+        lines = [json.dumps({'title': f'Note {i}', 'content': 'Body'}) for i in range(5)]
+        lines.insert(4, '{"title": "No content"}')
+        with self.assertRaisesMessage(transfer.InvalidImport, "Line 5: missing 'content'.") as caught:
+            transfer.import_ndjson(self.user.pk, lines, batch_size=2)
+        self.assertEqual(caught.exception.imported, 4)
+        self.assertEqual(Note.objects.filter(user=self.user, content='Body').count(), 4)
+
+        response = self.client.post(
+            reverse('import_notes'), {'file': SimpleUploadedFile('notes.ndjson', b'not json\n')},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['imported'], 0)
+
+    def test_commands_round_trip(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / 'notes.ndjson')
+        call_command('export_notes', 'testuser', '--output', path, stderr=StringIO())
+        User.objects.create_user(username='newcomer', password='newpass')
+        out = StringIO()
+        call_command('import_notes', 'newcomer', path, '--batch-size', '2', stdout=out)
+        self.assertIn('Imported 3 notes', out.getvalue())
+        self.assertEqual(Note.objects.filter(user__username='newcomer').count(), 3)
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        self.notes = [
+            Note.objects.create(user=self.user, title=f'Note {i}', content='Content')
+            for i in range(3)
+        ]
+        self.ids = [note.id for note in self.notes]
+
+    def bulk(self, action, ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('bulk_action'), {'action': action, 'ids': ids},
+                HTTP_ACCEPT='application/json',
+            )
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE "notes_note"', 'DELETE FROM "notes_note"'))]
+        return response, writes
+
+    def test_bulk_archive_is_one_update(self):
+        response, writes = self.bulk('archive', self.ids)
+        self.assertEqual(response.json(), {'action': 'archive', 'count': 3})
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(Note.objects.filter(archived=True).count(), 3)
+
+    def test_bulk_trash_then_delete(self):
+        self.bulk('trash', self.ids[:2])
+        self.assertEqual(Note.objects.filter(trashed=True).count(), 2)
+        # Only trashed notes can be deleted forever.
+        response, writes = self.bulk('delete', self.ids)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(list(Note.objects.values_list('id', flat=True)), self.ids[2:])
+
+    def test_bulk_is_scoped_to_owner(self):
+        other = User.objects.create_user(username='other', password='otherpass')
+        theirs = Note.objects.create(user=other, title='Theirs', content='Content')
+        response, _ = self.bulk('trash', [theirs.id])
+        self.assertEqual(response.json()['count'], 0)
+        theirs.refresh_from_db()
+        self.assertFalse(theirs.trashed)
+
+    def test_bulk_rejects_bad_input(self):
+        self.assertEqual(self.bulk('explode', self.ids)[0].status_code, 400)
+        self.assertEqual(self.bulk('archive', ['abc'])[0].status_code, 400)
+        self.assertEqual(self.client.get(reverse('bulk_action')).status_code, 405)
+
+    def test_bulk_form_redirects_back(self):
+        response = self.client.post(
+            reverse('bulk_action'), {'action': 'archive', 'ids': self.ids},
+            HTTP_REFERER='/archive/',
+        )
+        self.assertRedirects(response, '/archive/', fetch_redirect_response=False)
+
+    def test_single_note_views_only_write_flags(self):
+        note = self.notes[0]
+        for name in ('archive_note', 'unarchive_note', 'trash_note', 'restore_note'):
+            with self.subTest(view=name), CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse(name, args=[note.id]))
+            writes = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "notes_note"')]
+            self.assertEqual(len(writes), 1)
+            self.assertNotIn('"content"', writes[0])
+            self.assertIn('"change_seq"', writes[0])
+
+    def test_single_note_view_404_for_other_user(self):
+        other = User.objects.create_user(username='other', password='otherpass')
+        theirs = Note.objects.create(user=other, title='Theirs', content='Content')
+        response = self.client.get(reverse('archive_note', args=[theirs.id]))
+        self.assertEqual(response.status_code, 404)
+
 
 class SearchTests(TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        cache.clear()
     
     def test_search_by_title(self):
         Note.objects.create(user=self.user, title='Python Tutorial', content='Content 1')
@@ -223,7 +881,7 @@ class SearchTests(TestCase):
         response = self.client.get(reverse('notes'), {'q': 'Python'})
         notes = response.context['notes']
         
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
         self.assertEqual(notes[0].title, 'Python Tutorial')
     
     def test_search_by_content(self):
@@ -233,20 +891,326 @@ class SearchTests(TestCase):
         response = self.client.get(reverse('notes'), {'q': 'Python'})
         notes = response.context['notes']
         
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
         self.assertEqual(notes[0].content, 'Python is great')
     
     def test_search_case_insensitive(self):
         Note.objects.create(user=self.user, title='PYTHON', content='Content')
         response = self.client.get(reverse('notes'), {'q': 'python'})
         notes = response.context['notes']
-        self.assertEqual(notes.count(), 1)
+        self.assertEqual(len(notes), 1)
     
     def test_search_no_results(self):
         Note.objects.create(user=self.user, title='Test Note', content='Content')
         response = self.client.get(reverse('notes'), {'q': 'nonexistent'})
         notes = response.context['notes']
-        self.assertEqual(notes.count(), 0)
+        self.assertEqual(len(notes), 0)
+
+    def test_search_prefix_match(self):
+        Note.objects.create(user=self.user, title='Groceries', content='Buy tomatoes')
+        response = self.client.get(reverse('notes'), {'q': 'tomat'})
+        self.assertEqual(len(response.context['notes']), 1)
+
+    def test_search_ranks_title_matches_first(self):
+        Note.objects.create(user=self.user, title='Weekly log', content='Talked about django a bit')
+        Note.objects.create(user=self.user, title='Django', content='Deployment checklist')
+        response = self.client.get(reverse('notes'), {'q': 'django'})
+        notes = response.context['notes']
+        self.assertEqual([n.title for n in notes], ['Django', 'Weekly log'])
+
+    def test_search_highlights_snippet(self):
+        Note.objects.create(user=self.user, title='Note', content='Python <b>rocks</b>')
+        response = self.client.get(reverse('notes'), {'q': 'rocks'})
+        self.assertContains(response, '<mark>rocks</mark>')
+        self.assertNotContains(response, '<b>rocks</b>')
+
+    def test_search_excludes_trashed_and_other_users(self):
+        Note.objects.create(user=self.user, title='Python', content='x', trashed=True)
+        other = User.objects.create_user(username='other', password='otherpass')
+        Note.objects.create(user=other, title='Python', content='x')
+        response = self.client.get(reverse('notes'), {'q': 'python'})
+        self.assertEqual(len(response.context['notes']), 0)
+
+    def test_index_follows_edit_and_delete(self):
+        note = Note.objects.create(user=self.user, title='Old', content='alpha')
+        self.client.post(reverse('edit_note', args=[note.id]), {'title': 'New', 'content': 'beta'})
+        self.assertEqual(len(self.client.get(reverse('notes'), {'q': 'alpha'}).context['notes']), 0)
+        self.assertEqual(len(self.client.get(reverse('notes'), {'q': 'beta'}).context['notes']), 1)
+        note.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'beta OR new'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_rebuild_search_index_command(self):
+        Note.objects.create(user=self.user, title='Python', content='Content')
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 notes', out.getvalue())
+        response = self.client.get(reverse('notes'), {'q': 'python'})
+        self.assertEqual(len(response.context['notes']), 1)
+
+
+class PreviewTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+
+    def test_preview_is_bounded(self):
+        note = Note.objects.create(user=self.user, title='Big', content='x' * (PREVIEW_LENGTH * 3))
+        self.assertEqual(len(note.preview), PREVIEW_LENGTH)
+        self.assertEqual(note.content_length, PREVIEW_LENGTH * 3)
+        self.assertTrue(note.is_truncated)
+
+    def test_preview_follows_content_update(self):
+        note = Note.objects.create(user=self.user, title='Note', content='first')
+        note.content = 'second'
+        note.save(update_fields=['content'])
+        note.refresh_from_db()
+        self.assertEqual(note.preview, 'second')
+        self.assertEqual(note.content_length, 6)
+
+    def test_listings_do_not_load_content(self):
+        Note.objects.create(user=self.user, title='Active', content='body')
+        Note.objects.create(user=self.user, title='Archived', content='body', archived=True)
+        Note.objects.create(user=self.user, title='Trashed', content='body', trashed=True)
+        for url in (reverse('notes'), reverse('archive'), reverse('trash')):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                self.assertContains(response, 'body')
+            for query in queries:
+                self.assertNotIn('"notes_note"."content",', query['sql'])
+                self.assertNotIn('"notes_note"."content" ', query['sql'])
+
+    def test_edit_loads_full_content(self):
+        note = Note.objects.create(user=self.user, title='Big', content='y' * (PREVIEW_LENGTH + 1))
+        response = self.client.get(reverse('edit_note', args=[note.id]))
+        self.assertContains(response, 'y' * (PREVIEW_LENGTH + 1))
+
+
+@override_settings(NOTE_COMPRESS_MIN_LENGTH=1000)
+class CompressionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.content = ''.join(f'Line {i} of a pasted server log.\n' for i in range(200))
+        cache.clear()
+
+    def stored_type(self, note):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT typeof(content) FROM notes_note WHERE id = %s', [note.id])
+            return cursor.fetchone()[0]
+
+    def test_large_content_is_stored_compressed(self):
+        note = Note.objects.create(user=self.user, title='Log', content=self.content)
+        self.assertEqual(self.stored_type(note), 'blob')
+        note = Note.objects.get(id=note.id)
+        self.assertIsInstance(note.__dict__['content'], bytes)
+        self.assertEqual(note.content, self.content)
+        self.assertEqual(note.content_length, len(self.content))
+
+    def test_small_content_stays_text(self):
+        note = Note.objects.create(user=self.user, title='Short', content='short')
+        self.assertEqual(self.stored_type(note), 'text')
+        self.assertEqual(Note.objects.get(id=note.id).content, 'short')
+
+    def test_search_and_edit_see_compressed_content(self):
+        note = Note.objects.create(user=self.user, title='Log', content=self.content + 'pineapple\n')
+        response = self.client.get(reverse('notes'), {'q': 'pineap'})
+        self.assertContains(response, '<mark>pineapple</mark>')
+        response = self.client.get(reverse('edit_note', args=[note.id]))
+        self.assertContains(response, 'Line 199 of a pasted server log.')
+
+    def test_search_index_keeps_no_copy_of_the_text(self):
+        Note.objects.create(user=self.user, title='Log', content=self.content + 'pineapple\n')
+        tables = connection.introspection.table_names()
+        self.assertIn(f'{FTS_TABLE}_idx', tables)
+        self.assertNotIn(f'{FTS_TABLE}_content', tables)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('integrity-check')")
+
+    def test_revisions_of_compressed_content(self):
+        self.client.post(reverse('notes'), {'title': 'Log', 'content': self.content})
+        note = Note.objects.get()
+        edited = self.content.replace('Line 100 ', 'Line one hundred ')
+        self.client.post(reverse('edit_note', args=[note.id]), {'title': 'Log', 'content': edited})
+        first, second = note.revisions.order_by('id')
+        self.assertIsInstance(NoteRevision.objects.values_list('data', flat=True).get(id=first.id), bytes)
+        self.assertEqual(revisions.content_of(second), edited)
+
+
+@override_settings(NOTE_COMPRESS_MIN_LENGTH=1000)
+class CompressionBenchmarkTests(TransactionTestCase):
+    # bench_compression backs up the database, which SQLite cannot do
+    # while the connection holds a write transaction.
+    def test_bench_compression_command(self):
+        user = User.objects.create_user(username='testuser', password='testpass')
+        Note.objects.create(user=user, title='Log', content='pasted server log line\n' * 100)
+        out = StringIO()
+        call_command('bench_compression', '--iterations', '1', stdout=out)
+        self.assertIn('1 notes of at least 1000 characters', out.getvalue())
+        self.assertIn('Compressed file is', out.getvalue())
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        Note.objects.bulk_create(
+            Note(user=self.user, title=f'Note {i}', content='Content')
+            for i in range(PAGE_SIZE + 5)
+        )
+
+    def test_first_page_is_bounded(self):
+        response = self.client.get(reverse('notes'))
+        self.assertEqual(len(response.context['notes']), PAGE_SIZE)
+        self.assertContains(response, 'class="load-more"')
+
+    def test_load_more_returns_next_page_fragment(self):
+        first = self.client.get(reverse('notes'))
+        response = self.client.get(reverse('notes') + first.context['next_url'] + '&partial=1')
+        self.assertTemplateUsed(response, 'notes/_note_cards.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertNotIn('X-Next-Cursor', response)
+        ids = [n.id for n in first.context['notes']] + [n.id for n in response.context['notes']]
+        self.assertEqual(len(ids), PAGE_SIZE + 5)
+        self.assertEqual(set(ids), set(Note.objects.values_list('id', flat=True)))
+
+    def test_edit_between_pages_does_not_duplicate(self):
+        first = self.client.get(reverse('notes'))
+        oldest = Note.objects.order_by('updated_at', 'id').first()
+        self.client.post(reverse('edit_note', args=[oldest.id]), {'title': 'Bumped', 'content': 'x'})
+        second = self.client.get(reverse('notes') + first.context['next_url'])
+        first_ids = {n.id for n in first.context['notes']}
+        second_ids = {n.id for n in second.context['notes']}
+        self.assertFalse(first_ids & second_ids)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('notes'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_trash_is_paginated(self):
+        Note.objects.update(trashed=True)
+        response = self.client.get(reverse('trash'))
+        self.assertEqual(len(response.context['notes']), PAGE_SIZE)
+        response = self.client.get(reverse('trash') + response.context['next_url'] + '&partial=1')
+        self.assertTemplateUsed(response, 'notes/_trash_cards.html')
+        self.assertEqual(len(response.context['notes']), 5)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite-specific')
+class QueryPlanTests(TestCase):
+    """The listing queries must walk an index in order, never scan or sort."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.cursor = encode_cursor(
+            Note(pk=10, updated_at=timezone.now())
+        )
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queryset, index):
+        steps = self.plan(queryset)
+        self.assertIn(f'USING INDEX {index}', ' '.join(steps))
+        for step in steps:
+            self.assertFalse(step.startswith('SCAN notes_note'), steps)
+            self.assertNotIn('TEMP B-TREE', step, steps)
+
+    def test_listing_plans(self):
+        listings = [
+            (Note.objects.active(self.user), 'note_active_idx'),
+            (Note.objects.archived(self.user), 'note_archived_idx'),
+            (Note.objects.in_trash(self.user), 'note_trash_idx'),
+        ]
+        for queryset, index in listings:
+            with self.subTest(index=index):
+                self.assertIndexed(page_queryset(queryset)[:PAGE_SIZE + 1], index)
+                self.assertIndexed(page_queryset(queryset, self.cursor)[:PAGE_SIZE + 1], index)
+
+    def test_search_plan_does_not_scan_notes(self):
+        # Ranked results are sorted by bm25, so only the row lookup is checked.
+        steps = self.plan(search_notes(Note.objects.active(self.user), 'python')[:PAGE_SIZE])
+        self.assertIn('SEARCH notes_note USING INTEGER PRIMARY KEY (rowid=?)', steps)
+
+
+class ListCacheTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+
+    def get_notes(self, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or reverse('notes'))
+        # Rows actually listed; the ETag aggregate runs on every request.
+        note_queries = [
+            q for q in queries
+            if 'FROM "notes_note"' in q['sql'] and 'COUNT(' not in q['sql']
+        ]
+        return response, note_queries
+
+    def test_repeat_view_is_served_from_cache(self):
+        Note.objects.create(user=self.user, title='Cached', content='Content')
+        response, queries = self.get_notes()
+        self.assertEqual(len(queries), 1)
+        response, queries = self.get_notes()
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Cached')
+        self.assertEqual(listcache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_mutating_views_invalidate(self):
+        note = Note.objects.create(user=self.user, title='Note', content='Content')
+        mutations = [
+            lambda: self.client.post(reverse('notes'), {'title': 'New', 'content': 'x'}),
+            lambda: self.client.post(reverse('edit_note', args=[note.id]), {'title': 'Edited', 'content': 'x'}),
+            lambda: self.client.get(reverse('archive_note', args=[note.id])),
+            lambda: self.client.get(reverse('unarchive_note', args=[note.id])),
+            lambda: self.client.get(reverse('trash_note', args=[note.id])),
+            lambda: self.client.get(reverse('restore_note', args=[note.id])),
+            lambda: self.client.get(reverse('delete_forever', args=[note.id])),
+            lambda: self.client.post(reverse('empty_trash')),
+        ]
+        for mutate in mutations:
+            self.get_notes()
+            with self.settings(JOBS_MODE='eager'), self.captureOnCommitCallbacks(execute=True):
+                mutate()
+            _, queries = self.get_notes()
+            self.assertEqual(len(queries), 1)
+
+    def test_views_are_cached_separately(self):
+        Note.objects.create(user=self.user, title='Active', content='Content')
+        Note.objects.create(user=self.user, title='Archived', content='Content', archived=True)
+        self.get_notes()
+        response, queries = self.get_notes(reverse('archive'))
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Archived')
+        self.assertNotContains(response, '>Active<')
+
+    def test_users_are_cached_separately(self):
+        Note.objects.create(user=self.user, title='Mine', content='Content')
+        self.get_notes()
+        User.objects.create_user(username='other', password='otherpass')
+        self.client.login(username='other', password='otherpass')
+        response, _ = self.get_notes()
+        self.assertNotContains(response, 'Mine')
+
+    def test_metrics_requires_staff_or_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'notes_list_cache_hits_total 0')
 
 
 class ProfileTests(TestCase):
@@ -254,6 +1218,7 @@ class ProfileTests(TestCase):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        cache.clear()
     
     def test_view_profile(self):
         response = self.client.get(reverse('profile'))
@@ -268,6 +1233,740 @@ class ProfileTests(TestCase):
         self.assertEqual(self.user.first_name, 'John')
         self.assertEqual(self.user.last_name, 'Doe')
 
+    def test_unchanged_profile_post_writes_nothing(self):
+        self.user.first_name = 'John'
+        self.user.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('profile'), {'first_name': 'John', 'last_name': ''})
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual([sql for sql in writes if 'django_session' not in sql], [])
+
+    def test_name_change_writes_only_names(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('profile'), {'first_name': 'John', 'last_name': ''})
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and 'django_session' not in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "first_name"', updates[0])
+        self.assertNotIn('"password"', updates[0])
+
+
+class AvatarStorageTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        settings = self.settings(MEDIA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def stored_files(self):
+        return sorted(p.name for p in self.root.rglob('*') if p.is_file())
+
+    def test_letter_avatars_are_preloaded(self):
+        self.assertEqual(len(LETTER_AVATARS), 26)
+
+    def test_signups_share_letter_avatar(self):
+        ann = User.objects.create_user(username='ann')
+        amy = User.objects.create_user(username='amy')
+        bob = User.objects.create_user(username='bob')
+        self.assertEqual(ann.profile.profile_picture.name, amy.profile.profile_picture.name)
+        self.assertNotEqual(ann.profile.profile_picture.name, bob.profile.profile_picture.name)
+        self.assertTrue(is_content_name(ann.profile.profile_picture.name))
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_identical_uploads_are_stored_once(self):
+        image = BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(image, 'PNG')
+        names = []
+        for username in ('zed', 'zoe'):
+            user = User.objects.create_user(username=username, password='testpass')
+            self.client.force_login(user)
+            self.client.post(reverse('profile'), {
+                'profile_picture': SimpleUploadedFile('me.png', image.getvalue(), 'image/png'),
+            })
+            user.profile.refresh_from_db()
+            names.append(user.profile.profile_picture.name)
+        self.assertEqual(names[0], names[1])
+        self.assertTrue(names[0].endswith('.png'))
+        self.assertEqual(len(self.stored_files()), 2)  # the letter Z and the upload
+
+    def test_dedupe_command_collapses_copies(self):
+        for username in ('ann', 'amy'):
+            user = User.objects.create_user(username=username)
+            name = FileSystemStorage().save(
+                f'profile_pics/{username}_avatar.svg', ContentFile(LETTER_AVATARS['A']),
+            )
+            Profile.objects.filter(user=user).update(profile_picture=name)
+        out = StringIO()
+        call_command('dedupe_avatars', stdout=out)
+        self.assertIn('Moved 2 avatars', out.getvalue())
+        names = set(Profile.objects.values_list('profile_picture', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.stored_files(), [Path(names.pop()).name])
+
+    def test_dedupe_command_removes_unused_files(self):
+        bob = User.objects.create_user(username='bob')
+        letter = bob.profile.profile_picture.name
+        unused = avatar_storage.save('old.png', ContentFile(b'old picture'))
+        rendition = avatar_storage.save_derived(variant_name(unused, 48, 'webp'), ContentFile(b'x'))
+        fresh = avatar_storage.save('new.png', ContentFile(b'just uploaded'))
+        Profile.objects.filter(user=bob).update(profile_picture='')
+        hour_ago = time.time() - 2 * 3600
+        for name in (letter, unused, rendition):
+            os.utime(avatar_storage.path(name), (hour_ago, hour_ago))
+
+        out = StringIO()
+        call_command('dedupe_avatars', '--dry-run', stdout=out)
+        self.assertIn('Would remove 2 unused files', out.getvalue())
+        self.assertEqual(len(self.stored_files()), 4)
+        call_command('dedupe_avatars', stdout=out)
+        # The letter avatar stays though bob no longer uses it, and so does
+        # an upload too recent to be sure its profile is not being saved.
+        self.assertEqual(self.stored_files(), sorted([Path(letter).name, Path(fresh).name]))
+
+
+@override_settings(JOBS_MODE='eager')
+class AvatarThumbnailTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = self.settings(MEDIA_ROOT=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def upload(self, execute=True):
+        image = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        Image.new('RGB', (600, 400), 'blue').save(image, 'JPEG', exif=exif)
+        with self.captureOnCommitCallbacks(execute=execute):
+            self.client.post(reverse('profile'), {
+                'profile_picture': SimpleUploadedFile('me.jpg', image.getvalue(), 'image/jpeg'),
+            })
+        self.user.profile.refresh_from_db()
+        return self.user.profile
+
+    def test_renditions_are_square_and_stripped(self):
+        avatar = self.upload().avatar
+        self.assertTrue(avatar.has_thumbnails)
+        for size in AVATAR_SIZES:
+            for ext in FORMATS:
+                with self.subTest(size=size, ext=ext):
+                    with avatar_storage.open(variant_name(avatar.name, size, ext)) as f:
+                        rendition = Image.open(f)
+                        self.assertEqual(rendition.size, (size, size))
+                        self.assertFalse(rendition.getexif())
+
+    def test_pages_use_smallest_fitting_rendition(self):
+        avatar = self.upload().avatar
+        response = self.client.get(reverse('notes'))
+        self.assertContains(response, '<source type="image/webp" srcset="{} 1x, {} 2x">'.format(
+            avatar.variant_url(48, 'webp'), avatar.variant_url(96, 'webp'),
+        ), html=False)
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, avatar.variant_url(128, 'webp'))
+        self.assertNotContains(response, avatar.url + '"')
+
+    def test_original_is_used_until_renditions_exist(self):
+        profile = self.upload(execute=False)
+        self.assertFalse(profile.has_thumbnails)
+        response = self.client.get(reverse('notes'))
+        self.assertContains(response, f'src="{profile.avatar.url}"')
+
+
+@register('flaky')
+def flaky(fail_times):
+    flaky.calls += 1
+    if flaky.calls <= fail_times:
+        raise RuntimeError('boom')
+    return flaky.calls
+
+
+@override_settings(JOBS_MODE='worker', JOB_MAX_ATTEMPTS=3)
+class JobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        flaky.calls = 0
+
+    def test_unknown_job_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('no_such_job')
+
+    def test_retries_with_backoff_then_succeeds(self):
+        job = enqueue('flaky', fail_times=1)
+        with self.assertLogs('notes.jobs', 'ERROR'):
+            first = run_job(job.pk)
+        self.assertEqual((first.status, first.attempts), (Job.QUEUED, 1))
+        self.assertIn('RuntimeError', first.error)
+        self.assertGreater(first.run_after, timezone.now())
+        self.assertIsNone(run_job(job.pk))  # not due yet
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        second = run_job(job.pk)
+        self.assertEqual((second.status, second.result, second.error), (Job.DONE, 2, ''))
+
+    def test_fails_after_max_attempts(self):
+        job = enqueue('flaky', fail_times=5)
+        for _ in range(3):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            with self.assertLogs('notes.jobs', 'ERROR'):
+                job = run_job(job.pk)
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+
+    def test_job_is_claimed_once(self):
+        job = enqueue('flaky', fail_times=0)
+        self.assertEqual(claim(job.pk).status, Job.RUNNING)
+        self.assertIsNone(claim(job.pk))
+
+    def test_stale_jobs_are_requeued(self):
+        job = enqueue('flaky', fail_times=0)
+        claim(job.pk)
+        with self.settings(JOB_TIMEOUT=0):
+            self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(run_job(job.pk).status, Job.DONE)
+
+    def test_status_polling(self):
+        response = self.client.post(reverse('empty_trash'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        url = response.json()['url']
+        self.assertEqual(self.client.get(url).json()['status'], Job.QUEUED)
+        run_job()
+        self.assertEqual(self.client.get(url).json()['result'], {'deleted': 0})
+        self.client.force_login(User.objects.create_user(username='other'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_delete_user_in_batches(self):
+        for i in range(5):
+            Note.objects.create(user=self.user, title=f'Note {i}', content='x')
+        job = enqueue('delete_user', user_id=self.user.pk)
+        with patch('notes.models.DELETE_BATCH_SIZE', 2):
+            job = run_job(job.pk)
+        self.assertEqual(job.result, {'deleted_notes': 5})
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+
+# A TransactionTestCase, so the worker's threads and its closing of
+# connections between jobs see committed data.
+@override_settings(JOBS_MODE='worker')
+class JobWorkerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+
+    def test_worker_command_drains_queue(self):
+        Note.objects.create(user=self.user, title='Trashed', content='x', trashed=True)
+        Note.objects.create(user=self.user, title='Kept', content='x')
+        self.client.post(reverse('empty_trash'))
+        out = StringIO()
+        call_command('run_jobs', '--burst', stdout=out)
+        self.assertIn('ran 1 jobs', out.getvalue())
+        self.assertEqual(list(Note.objects.values_list('title', flat=True)), ['Kept'])
+
+    def test_worker_threads(self):
+        Note.objects.create(user=self.user, title='Kept', content='x')
+        self.client.post(reverse('empty_trash'))
+        self.client.post(reverse('empty_trash'))
+        out = StringIO()
+        call_command('run_jobs', '--burst', '--threads', '2', stdout=out)
+        self.assertIn('ran 2 jobs', out.getvalue())
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_worker_processes_stop_on_sigterm(self):
+        children = []
+
+        def process(**kwargs):
+            child = Mock()
+            # The parent is sent SIGTERM while waiting for its first child.
+            child.join.side_effect = lambda: signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+            children.append(child)
+            return child
+
+        previous = signal.getsignal(signal.SIGTERM)
+        with patch('notes.management.commands.run_jobs.multiprocessing.Process', process):
+            call_command('run_jobs', '--processes', '2')
+        for child in children:
+            child.terminate.assert_called()
+            child.join.assert_called()
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+    @override_settings(JOBS_MODE='thread', JOB_TIMEOUT=60)
+    def test_sweep_runs_jobs_left_by_a_restarted_process(self):
+        # Queued by a process that restarted before running it, and cut
+        # off while running.
+        queued = Job.objects.create(name='empty_trash', user=self.user, kwargs={'user_id': self.user.pk})
+        stale = Job.objects.create(
+            name='empty_trash', user=self.user, kwargs={'user_id': self.user.pk},
+            status=Job.RUNNING, attempts=1, locked_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(jobs.sweep(), 2)
+        deadline = time.monotonic() + 10
+        while Job.objects.exclude(status=Job.DONE).exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(
+            list(Job.objects.filter(pk__in=[queued.pk, stale.pk]).values_list('status', flat=True)),
+            [Job.DONE, Job.DONE],
+        )
+
+
+class ProfileContextTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+
+    def test_list_page_query_count(self):
+        Note.objects.create(user=self.user, title='Note', content='Content')
+        # User, ETag aggregate, notes and the first avatar lookup; the
+        # session comes from the session cache.
+        with self.assertNumQueries(4):
+            self.client.get(reverse('notes'))
+        # Cached list and avatar: user and the ETag aggregate.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('notes'))
+        self.assertContains(response, self.user.profile.avatar_url)
+
+    def test_redirects_do_not_load_profile(self):
+        note = Note.objects.create(user=self.user, title='Note', content='Content')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('archive_note', args=[note.id]))
+        self.assertFalse([q for q in queries if 'notes_profile' in q['sql']])
+
+    def test_avatar_cache_invalidated_on_profile_update(self):
+        self.client.get(reverse('notes'))
+        profile = self.user.profile
+        profile.profile_picture = 'profile_pics/new.svg'
+        profile.save()
+        response = self.client.get(reverse('archive'))
+        self.assertContains(response, 'profile_pics/new.svg')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        self.note = Note.objects.create(user=self.user, title='Note', content='Content')
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_listing_is_not_modified(self):
+        for url in (reverse('notes'), reverse('archive'), reverse('trash')):
+            with self.subTest(url=url):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+
+    def test_not_modified_skips_rendering(self):
+        etag = self.client.get(reverse('notes'))['ETag']
+        response = self.client.get(reverse('notes'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, 'notes/list.html')
+
+    def test_transitions_change_validators(self):
+        urls = (reverse('notes'), reverse('archive'), reverse('trash'))
+        transitions = [
+            ('archive_note', {reverse('notes'), reverse('archive')}),
+            ('unarchive_note', {reverse('notes'), reverse('archive')}),
+            ('trash_note', {reverse('notes'), reverse('trash')}),
+            ('restore_note', {reverse('notes'), reverse('trash')}),
+        ]
+        for name, affected in transitions:
+            before = {url: self.client.get(url)['ETag'] for url in urls}
+            self.client.get(reverse(name, args=[self.note.id]))
+            for url in urls:
+                with self.subTest(transition=name, url=url):
+                    changed = self.client.get(url)['ETag'] != before[url]
+                    self.assertEqual(changed, url in affected)
+
+    def test_delete_changes_trash_validator(self):
+        Note.objects.filter(id=self.note.id).trash()
+        before = self.client.get(reverse('trash'))['ETag']
+        self.client.get(reverse('delete_forever', args=[self.note.id]))
+        self.assertNotEqual(self.client.get(reverse('trash'))['ETag'], before)
+
+    def test_edit_page_validators(self):
+        url = reverse('edit_note', args=[self.note.id])
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.revalidate(url).status_code, 304)
+        etag = response['ETag']
+        self.client.post(url, {'title': 'Changed', 'content': 'Content'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_edit_other_users_note_is_404(self):
+        other = User.objects.create_user(username='other', password='otherpass')
+        theirs = Note.objects.create(user=other, title='Theirs', content='Content')
+        self.assertEqual(self.client.get(reverse('edit_note', args=[theirs.id])).status_code, 404)
+
+    def test_profile_change_changes_validator(self):
+        etag = self.client.get(reverse('notes'))['ETag']
+        self.client.post(reverse('profile'), {'first_name': 'New', 'last_name': 'Name'})
+        self.assertEqual(self.client.get(reverse('notes'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pages_are_private(self):
+        response = self.client.get(reverse('notes'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.async_client.force_login(self.user)
+        cache.clear()
+        self.note = Note.objects.create(user=self.user, title='Groceries', content='Milk and eggs')
+
+    async def test_pages_render(self):
+        await Note.objects.filter(pk=self.note.pk).aupdate(archived=True)
+        archived = await self.async_client.get(reverse('archive'))
+        self.assertContains(archived, 'Groceries')
+        for url in (reverse('notes'), reverse('trash')):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotContains(response, 'Groceries')
+
+    async def test_search(self):
+        response = await self.async_client.get(reverse('notes'), {'q': 'egg'})
+        self.assertContains(response, '<mark>eggs</mark>')
+
+    async def test_edit_page(self):
+        response = await self.async_client.get(reverse('edit_note', args=[self.note.id]))
+        self.assertContains(response, 'Milk and eggs')
+        other = await User.objects.acreate(username='other')
+        note = await Note.objects.acreate(user=other, title='Secret', content='x')
+        response = await self.async_client.get(reverse('edit_note', args=[note.id]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_post_is_handled_by_sync_view(self):
+        await self.async_client.post(reverse('notes'), {'title': 'New', 'content': 'Body'})
+        await self.async_client.post(
+            reverse('edit_note', args=[self.note.id]), {'title': 'Edited', 'content': 'Body'},
+        )
+        titles = {note.title async for note in Note.objects.filter(user=self.user)}
+        self.assertEqual(titles, {'New', 'Edited'})
+
+    async def test_conditional_get(self):
+        for url in (reverse('notes'), reverse('edit_note', args=[self.note.id])):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                response = await self.async_client.get(
+                    url, headers={'if-none-match': response['ETag']},
+                )
+                self.assertEqual(response.status_code, 304)
+
+    async def test_server_timing(self):
+        response = await self.async_client.get(reverse('notes'))
+        self.assertNotIn('Server-Timing', response)
+        self.user.is_staff = True
+        await self.user.asave(update_fields=['is_staff'])
+        response = await self.async_client.get(reverse('notes'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    async def test_requires_login(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('notes'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response.url)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / 'avatars').mkdir()
+        (self.root / 'avatars' / 'ann_avatar.svg').write_bytes(b'0123456789')
+        (self.root / 'avatars' / '3f786850e387550f.svg').write_bytes(b'<svg/>')
+        settings = self.settings(MEDIA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.url = reverse('media', args=['avatars/ann_avatar.svg'])
+
+    def test_streams_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_hashed_names_are_immutable(self):
+        response = self.client.get(reverse('media', args=['avatars/3f786850e387550f.svg']))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_range(self):
+        cases = [('bytes=2-4', b'234', 'bytes 2-4/10'), ('bytes=7-', b'789', 'bytes 7-9/10'),
+                 ('bytes=-2', b'89', 'bytes 8-9/10')]
+        for header, body, content_range in cases:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, headers={'range': header})
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+
+    def test_unsatisfiable_and_stale_ranges(self):
+        response = self.client.get(self.url, headers={'range': 'bytes=20-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        response = self.client.get(self.url, headers={'range': 'bytes=2-4', 'if-range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_escaping_paths(self):
+        for path in ('avatars/missing.svg', 'avatars'):
+            with self.subTest(path=path):
+                response = self.client.get(f'/media/{path}')
+                self.assertEqual(response.status_code, 404)
+        response = self.client.get('/media/../secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_proxy_offload(self):
+        with self.settings(MEDIA_ACCEL='x-accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/avatars/ann_avatar.svg')
+        self.assertFalse(response.content)
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], str(self.root / 'avatars' / 'ann_avatar.svg'))
+
+
+class SQLiteConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        cache.clear()
+
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000})
+
+    def test_concurrent_reads_and_writes(self):
+        errors = []
+
+        def run(work):
+            try:
+                work()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        def write():
+            for _ in range(20):
+                # Reads before it writes: with deferred transactions this
+                # fails at once with "database is locked" under contention.
+                with transaction.atomic():
+                    count = Note.objects.filter(user=self.user).count()
+                    Note.objects.create(user=self.user, title=f'Note {count}', content='x')
+
+        def read():
+            client = Client()
+            client.force_login(self.user)
+            for _ in range(20):
+                self.assertEqual(client.get(reverse('notes')).status_code, 200)
+                self.assertEqual(client.get(reverse('notes'), {'q': 'note'}).status_code, 200)
+
+        threads = [threading.Thread(target=run, args=(work,)) for work in [write, read] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        titles = Note.objects.values_list('title', flat=True)
+        self.assertEqual(len(set(titles)), 80)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing between the test database and a replica snapshot of it,
+    registered here as the ``replica`` alias."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        connections.settings[REPLICA] = {
+            **connections['default'].settings_dict, 'NAME': f'{cls.tmp.name}/replica.sqlite3',
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        cache.clear()
+        self.note = Note.objects.create(user=self.user, title='Old title', content='x')
+        # A snapshot stands in for a lagging replica. connect() directly:
+        # the test case only lets its declared databases connect on demand.
+        connections['default'].ensure_connection()
+        if connections[REPLICA].connection is None:
+            connections[REPLICA].connect()
+        connections['default'].connection.backup(connections[REPLICA].connection)
+        Note.objects.filter(pk=self.note.pk).update(title='New title')
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_listing_reads_from_replica(self):
+        for url in (reverse('notes'), reverse('notes') + '?q=title'):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Old title')
+        response = self.client.get(reverse('edit_note', args=[self.note.id]))
+        self.assertContains(response, 'New title')
+
+    def test_pinned_to_primary_after_a_change(self):
+        self.client.post(reverse('edit_note', args=[self.note.id]), {'title': 'Edited', 'content': 'x'})
+        self.assertEqual(Note.objects.using('default').get().title, 'Edited')
+        self.assertContains(self.client.get(reverse('notes')), 'Edited')
+        # Once the pin has expired the lagging replica is read again.
+        with self.settings(REPLICA_PIN_SECONDS=0):
+            cache.clear()
+            self.assertContains(self.client.get(reverse('notes')), 'Old title')
+
+    def test_pin_does_not_depend_on_the_cache(self):
+        self.client.get(reverse('archive_note', args=[self.note.id]))
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+        # As if the next request went to a worker with its own cache.
+        cache.clear()
+        self.assertContains(self.client.get(reverse('archive')), 'New title')
+
+    def test_reads_do_not_pin(self):
+        cache.clear()
+        response = self.client.get(reverse('notes'))
+        self.assertContains(response, 'Old title')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        # Another user's pin does not apply.
+        other = User.objects.create_user(username='other', password='testpass')
+        client = Client()
+        client.force_login(other)
+        client.post(reverse('notes'), {'title': 'Theirs', 'content': 'x'})
+        self.client.cookies[PIN_COOKIE] = client.cookies[PIN_COOKIE].value
+        self.assertContains(self.client.get(reverse('notes')), 'Old title')
+
+    @override_settings(ROOT_URLCONF=__name__, REPLICA_PIN_SECONDS=0)
+    async def test_async_listing_reads_from_replica(self):
+        response = await self.async_client.get(reverse('archive'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(await self.async_client.get(reverse('notes')), 'Old title')
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass', is_staff=True)
+        self.client.login(username='testuser', password='testpass')
+        cache.clear()
+        Note.objects.create(user=self.user, title='Note', content='Content')
+
+    def metrics(self, response):
+        return {
+            part.split(';')[0].strip(): part for part in response['Server-Timing'].split(',')
+        }
+
+    def test_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('notes'))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'ctx', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', metrics['db'])
+        self.assertNotIn('dur=0.0', metrics['tpl'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('notes')))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_only_staff_and_token_holders(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertNotIn('Server-Timing', self.client.get(reverse('notes')))
+        response = self.client.get(reverse('notes'), headers={'authorization': 'Bearer wrong'})
+        self.assertNotIn('Server-Timing', response)
+        response = self.client.get(reverse('notes'), headers={'authorization': 'Bearer secret'})
+        self.assertIn('total', self.metrics(response))
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_TOP_QUERIES=2)
+    def test_slow_request_log(self):
+        with self.assertLogs('notes.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('notes'))
+        record = logs.records[0].request_timing
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/', 200))
+        self.assertEqual(len(record['slowest']), 2)
+        self.assertGreaterEqual(record['slowest'][0]['ms'], record['slowest'][1]['ms'])
+        self.assertEqual(json.loads(logs.records[0].args[1]), record)
+
+    def test_fast_request_not_logged(self):
+        with self.assertNoLogs('notes.instrumentation', 'WARNING'):
+            self.client.get(reverse('notes'))
+
+    def test_repeated_queries(self):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            for note in Note.objects.all():
+                note.user.username
+                note.user.username
+            User.objects.filter(pk=self.user.pk).exists()
+            User.objects.filter(pk=self.user.pk).exists()
+        finally:
+            _current.reset(token)
+        repeated = timing.repeated(2)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0][1], 2)
+        self.assertEqual(len(timing.queries), 4)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_notes(self):
+        call_command('seed_notes', '--users', '2', '--notes', '50', '--sizes', '10:1,1000:1',
+                     '--trashed', '0.2', stdout=StringIO())
+        notes = Note.objects.filter(user__username__startswith='bench-')
+        self.assertEqual(notes.count(), 100)
+        self.assertFalse(notes.filter(trashed=True, trashed_at=None).exists())
+        self.assertFalse(notes.exclude(content_length__in=[10, 1000]).exists())
+        note = notes.filter(content_length=1000).first()
+        self.assertEqual(note.preview, note.content[:PREVIEW_LENGTH])
+        self.assertTrue(search_notes(notes, note.title.split()[0]).exists())
+
+    def test_bench_and_baseline(self):
+        call_command('seed_notes', '--users', '1', '--notes', '60', stdout=StringIO())
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / 'baseline.json'
+        args = ['bench', '--iterations', '2', '--warmup', '0', '--only', 'notes', '--only', 'trash']
+        out = StringIO()
+        call_command(*args, '--save-baseline', str(path), stdout=out, stderr=StringIO())
+        baseline = json.loads(path.read_text())
+        self.assertEqual(set(baseline), {'notes', 'trash'})
+        self.assertEqual(set(baseline['notes']), {'p50', 'p95', 'p99', 'queries', 'bytes'})
+        self.assertGreater(baseline['notes']['bytes'], 0)
+
+        baseline['notes']['queries'] -= 1
+        path.write_text(json.dumps(baseline))
+        with self.assertRaisesMessage(CommandError, 'notes: '):
+            call_command(*args, '--baseline', str(path), stdout=StringIO(), stderr=StringIO())
+
 
 class AuthenticationRequiredTests(TestCase):
     def test_notes_list_requires_login(self):
@@ -0,0 +1,214 @@
+"""Bulk export and import of a user's notes.
+
+The exports are generators for StreamingHttpResponse (or a file): they
+read notes EXPORT_CHUNK_SIZE at a time with .iterator() and yield about
+STREAM_CHUNK_SIZE bytes at a time, so memory stays flat whatever the note
+count. The Markdown export is a zip built as it streams; zipfile can write
+to a stream it cannot seek, putting each entry's sizes after its data.
+Under ASGI, aiter_chunks() makes an export an async iterator; Django
+would otherwise read a sync one whole before sending it.
+
+import_ndjson() reads the NDJSON export format one line at a time and
+inserts IMPORT_BATCH_SIZE notes per bulk_create, each batch in its own
+transaction with one number of the owner's change sequence (see sync.py).
+"""
+import json
+import zipfile
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import listcache
+from .models import Note, next_change_seq
+
+EXPORT_CHUNK_SIZE = 500
+STREAM_CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+
+EXPORT_FIELDS = ('id', 'title', 'content', 'archived', 'trashed', 'created_at', 'updated_at')
+
+
+class InvalidImport(ValueError):
+    def __init__(self, message, imported):
+        super().__init__(message)
+        self.imported = imported
+
+
+def _notes(user_id):
+    return (
+        Note.objects.filter(user_id=user_id).order_by('id').only(*EXPORT_FIELDS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def export_ndjson(user_id):
+    """`user_id`'s notes as NDJSON: one object with EXPORT_FIELDS per line."""
+    buffer = []
+    size = 0
+    for note in _notes(user_id):
+        line = json.dumps(
+            {field: getattr(note, field) for field in EXPORT_FIELDS},
+            cls=DjangoJSONEncoder, separators=(',', ':'),
+        ).encode() + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+class _ZipStream:
+    """A write-only file object that collects what ZipFile writes to it."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _markdown_name(note):
+    folder = 'trash' if note.trashed else 'archive' if note.archived else 'notes'
+    return f'{folder}/{slugify(note.title)[:50] or "untitled"}-{note.id}.md'
+
+
+def export_markdown(user_id):
+    """`user_id`'s notes as a zip of Markdown files, one per note, in
+    notes/, archive/ and trash/ folders."""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for note in _notes(user_id):
+            info = zipfile.ZipInfo(
+                _markdown_name(note), timezone.localtime(note.updated_at).timetuple()[:6],
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            body = f'# {note.title}\n\n{note.content}\n' if note.title else f'{note.content}\n'
+            archive.writestr(info, body)
+            if len(stream.buffer) >= STREAM_CHUNK_SIZE:
+                yield stream.take()
+    yield stream.take()
+
+
+async def aiter_chunks(chunks):
+    """The export generator `chunks` as an async iterator. Each chunk is
+    made in the thread sync code runs in, one at a time, so neither the
+    queries nor the compression block the event loop."""
+    advance = sync_to_async(next)
+    try:
+        while (chunk := await advance(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Frees the export's cursor if the client went away early.
+        await sync_to_async(chunks.close)()
+
+
+def _datetime(value, field):
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string.')
+    parsed = datetime.fromisoformat(value)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def _parse(user_id, line):
+    """(Note, created_at, updated_at) from one NDJSON line."""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object.')
+    title = data.get('title', '')
+    content = data['content']
+    archived = data.get('archived', False)
+    trashed = data.get('trashed', False)
+    if not (isinstance(title, str) and isinstance(content, str)):
+        raise ValueError('title and content must be strings.')
+    if len(title) > Note._meta.get_field('title').max_length:
+        raise ValueError('title is too long.')
+    if not (isinstance(archived, bool) and isinstance(trashed, bool)):
+        raise ValueError('archived and trashed must be true or false.')
+    created_at = _datetime(data.get('created_at'), 'created_at')
+    updated_at = _datetime(data.get('updated_at'), 'updated_at')
+    note = Note(
+        user_id=user_id,
+        title=title,
+        content=content,
+        archived=archived and not trashed,
+        trashed=trashed,
+        trashed_at=(updated_at or timezone.now()) if trashed else None,
+    )
+    # bulk_create skips save(), which fills these in.
+    note.refresh_preview()
+    return note, created_at, updated_at
+
+
+def _restore_dates(batch):
+    """bulk_create stamps both dates with the current time; put back the
+    exported ones."""
+    updates = {}
+    for index, field in enumerate(('created_at', 'updated_at'), 1):
+        whens = [When(id=row[0].id, then=Value(row[index])) for row in batch if row[index]]
+        if whens:
+            updates[field] = Case(*whens, default=F(field), output_field=DateTimeField())
+    if updates:
+        Note.objects.filter(id__in=[row[0].id for row in batch]).update(**updates)
+
+
+def _flush(user_id, batch):
+    with transaction.atomic():
+        seq = next_change_seq(user_id)
+        for note, _, _ in batch:
+            note.change_seq = seq
+        Note.objects.bulk_create([note for note, _, _ in batch])
+        _restore_dates(batch)
+    count = len(batch)
+    batch.clear()
+    return count
+
+
+def import_ndjson(user_id, lines, batch_size=IMPORT_BATCH_SIZE):
+    """Create a note for `user_id` from each line of `lines` (str or
+    bytes, e.g. an open file or an upload) in the export_ndjson() format;
+    ``title``, ``archived``, ``trashed`` and the dates are optional.
+
+    Returns the number of notes created. Raises InvalidImport at the first
+    bad line; the batches before it stay imported.
+    """
+    imported = 0
+    batch = []
+    try:
+        for number, line in enumerate(lines, 1):
+            try:
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8-sig' if number == 1 else 'utf-8')
+                if not line.strip():
+                    continue
+                batch.append(_parse(user_id, line))
+            except KeyError as exc:
+                raise InvalidImport(f'Line {number}: missing {exc}.', imported) from exc
+            except ValueError as exc:
+                raise InvalidImport(f'Line {number}: {exc}', imported) from exc
+            if len(batch) >= batch_size:
+                imported += _flush(user_id, batch)
+        if batch:
+            imported += _flush(user_id, batch)
+    finally:
+        if imported:
+            listcache.bump_generation(user_id)
+    return imported
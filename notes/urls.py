@@ -1,24 +1,43 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views, views
 from .views import (
-    notes_list, login_view, edit_note,
-    archive_notes, archive_note, unarchive_note,
-    trash_note, restore_note, delete_forever, trash_notes,
+    login_view, archive_note, unarchive_note,
+    trash_note, restore_note, delete_forever,
     profile_view, signup_view, logout_view, empty_trash,
+    cache_metrics, bulk_action, job_status, note_revisions, note_revision,
+    autosave_note, sync_notes, export_notes, import_notes,
 )
 
-urlpatterns = [
-    path('', notes_list, name='notes'),
-    path('login/', login_view, name='login'),
-    path('signup/', signup_view, name='signup'),
-    path('logout/', logout_view, name='logout'),
-    path('edit/<int:note_id>/', edit_note, name='edit_note'),
-    path('archive/', archive_notes, name='archive'),
-    path('archive-note/<int:note_id>/', archive_note, name='archive_note'),
-    path('unarchive-note/<int:note_id>/', unarchive_note, name='unarchive_note'),
-    path('trash-note/<int:note_id>/', trash_note, name='trash_note'),
-    path('restore-note/<int:note_id>/', restore_note, name='restore_note'),
-    path('delete-forever/<int:note_id>/', delete_forever, name='delete_forever'),
-    path('trash/', trash_notes, name='trash'),
-    path('empty-trash/', empty_trash, name='empty_trash'),
-    path('profile/', profile_view, name='profile'),
-]
\ No newline at end of file
+
+def build_urlpatterns(read_views):
+    """URL patterns with the list, archive, trash and edit pages served by
+    `read_views` (views or async_views)."""
+    return [
+        path('', read_views.notes_list, name='notes'),
+        path('login/', login_view, name='login'),
+        path('signup/', signup_view, name='signup'),
+        path('logout/', logout_view, name='logout'),
+        path('edit/<int:note_id>/', read_views.edit_note, name='edit_note'),
+        path('edit/<int:note_id>/autosave/', autosave_note, name='autosave_note'),
+        path('edit/<int:note_id>/history/', note_revisions, name='note_revisions'),
+        path('edit/<int:note_id>/history/<int:revision_id>/', note_revision, name='note_revision'),
+        path('archive/', read_views.archive_notes, name='archive'),
+        path('archive-note/<int:note_id>/', archive_note, name='archive_note'),
+        path('unarchive-note/<int:note_id>/', unarchive_note, name='unarchive_note'),
+        path('trash-note/<int:note_id>/', trash_note, name='trash_note'),
+        path('restore-note/<int:note_id>/', restore_note, name='restore_note'),
+        path('delete-forever/<int:note_id>/', delete_forever, name='delete_forever'),
+        path('trash/', read_views.trash_notes, name='trash'),
+        path('empty-trash/', empty_trash, name='empty_trash'),
+        path('bulk/', bulk_action, name='bulk_action'),
+        path('jobs/<int:job_id>/', job_status, name='job_status'),
+        path('sync/', sync_notes, name='sync_notes'),
+        path('export/', export_notes, name='export_notes'),
+        path('import/', import_notes, name='import_notes'),
+        path('profile/', profile_view, name='profile'),
+        path('metrics/', cache_metrics, name='metrics'),
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views if settings.ASYNC_VIEWS else views)
@@ -1,120 +1,458 @@
+import json
+import time
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
-from .models import Note, Profile
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.template.defaultfilters import pluralize
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_POST
+from . import jobs, listcache, revisions, sync, transfer
+from .conditional import (
+    active_etag, archive_etag, conditional_page, note_etag, note_last_modified, trash_etag,
+)
+from .models import LISTING_FIELDS, Job, Note, NoteQuerySet, NoteRevision, Profile
 from .forms import ProfileForm
-from django.db.models import Q
+from .images import schedule_thumbnails
+from .instrumentation import may_read_metrics
+from .pagination import PAGE_SIZE, CursorPage, InvalidCursor, paginate
+from .routers import read_from_replica
+from .search import search_notes
+
+
+def _render_listing(request, notes, template, fragment, context=None):
+    """Render one keyset page of `notes`, reusing the cached cards if the
+    user's notes have not changed since they were rendered.
+
+    With ``?partial=1`` only the cards are returned, for the "load more"
+    script; the URL of the page after that goes in ``X-Next-Cursor``.
+    """
+    cursor = request.GET.get('cursor')
+    key = listcache.fragment_key(request.user.pk, request.resolver_match.url_name, cursor)
+    cards = listcache.get_fragment(key)
+    if cards is None:
+        try:
+            page = paginate(notes, cursor)
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid cursor.')
+        cards = _render_cards(page, fragment)
+        listcache.set_fragment(key, cards)
+    return _render_page(request, cards, template, context)
+
+
+def _render_cards(page, fragment):
+    return {
+        'html': render_to_string(fragment, {'notes': page.object_list}),
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+    }
+
+
+def _render_page(request, cards, template, context=None):
+    context = {
+        **(context or {}),
+        'cards': mark_safe(cards['html']),
+        'has_notes': cards['count'] > 0,
+    }
+    if cards['next_cursor']:
+        params = request.GET.copy()
+        params.pop('partial', None)
+        params['cursor'] = cards['next_cursor']
+        context['next_url'] = f'?{params.urlencode()}'
+    if request.GET.get('partial'):
+        response = HttpResponse(context['cards'])
+        if 'next_url' in context:
+            response['X-Next-Cursor'] = context['next_url']
+        return response
+    return render(request, template, context)
 
 
 @login_required
+@read_from_replica
+@conditional_page(active_etag)
 def notes_list(request):
     if request.method == 'POST':
-        Note.objects.create(
-            user=request.user,
-            title=request.POST.get('title', ''),
-            content=request.POST.get('content'),
-        )
+        with transaction.atomic():
+            note = Note.objects.create(
+                user=request.user,
+                title=request.POST.get('title', ''),
+                content=request.POST.get('content'),
+            )
+            revisions.record(note)
+        listcache.bump_generation(request.user.pk)
         return redirect('/')
 
-    notes = Note.objects.filter(
-        user=request.user,
-        archived=False,
-        trashed=False
-    )
+    notes = Note.objects.active(request.user).only(*LISTING_FIELDS)
 
+    context = {'bulk_actions': [('archive', 'Archive'), ('trash', 'Delete')]}
     q = request.GET.get('q', '').strip()
     if q:
-        notes = notes.filter(
-            Q(title__icontains=q) | Q(content__icontains=q)
-        )
+        # Ranked results have no stable keyset; show the best page of them.
+        page = CursorPage(list(search_notes(notes, q)[:PAGE_SIZE]))
+        cards = _render_cards(page, 'notes/_note_cards.html')
+        return _render_page(request, cards, 'notes/list.html', {**context, 'query': q})
 
-    notes = notes.order_by('-updated_at')
-
-    return render(request, 'notes/list.html', {'notes': notes})
+    return _render_listing(request, notes, 'notes/list.html', 'notes/_note_cards.html', context)
 
 
 @login_required
+@conditional_page(note_etag, note_last_modified)
 def edit_note(request, note_id):
     note = get_object_or_404(Note, id=note_id, user=request.user)
 
     if request.method == 'POST':
+        previous = (note.title, note.content)
         note.title = request.POST.get('title', '')
         note.content = request.POST.get('content')
-        note.save()
+        prepared = revisions.prepare(note.pk, (note.title, note.content), previous)
+        with transaction.atomic():
+            note.save()
+            revisions.record(note, previous, prepared)
+        listcache.bump_generation(request.user.pk)
         return redirect('/')
 
     return render(request, 'notes/edit.html', {'note': note})
 
 
+def _autosave_payload(body):
+    """(version, title or None, changes) from an autosave request body;
+    raises ValueError if it is malformed."""
+    try:
+        payload = json.loads(body)
+        version = payload['version']
+        title = payload.get('title')
+        changes = [(start, end, text) for start, end, text in payload.get('changes', [])]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(e)
+    if not isinstance(version, int) or not (title is None or isinstance(title, str)):
+        raise ValueError('Invalid version or title.')
+    for start, end, text in changes:
+        if not (isinstance(start, int) and isinstance(end, int) and isinstance(text, str)):
+            raise ValueError('Invalid change.')
+    return version, title, changes
+
+
+def _apply_changes(content, changes):
+    """`content` with autosave `changes` applied, or None if one is out of
+    range."""
+    for start, end, text in changes:
+        if not 0 <= start <= end <= len(content):
+            return None
+        content = content[:start] + text + content[end:]
+    return content
+
+
 @login_required
+@require_POST
+def autosave_note(request, note_id):
+    """Save an edit from the editor without a page load.
+
+    Takes JSON ``{"version": n, "title": ..., "changes": [[start, end,
+    text], ...]}``. Each change replaces ``content[start:end]`` (counted in
+    characters) with ``text``, applied in order to the content the note
+    had at version n; ``title`` and ``changes`` are optional. Answers with
+    the new ``version``, or 409 with the note's current state if it was
+    saved elsewhere since version n.
+    """
+    try:
+        version, title, changes = _autosave_payload(request.body)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid autosave.')
+    if title is not None and len(title) > Note._meta.get_field('title').max_length:
+        return HttpResponseBadRequest('Title too long.')
+
+    # Diff the history before locking; record() redoes it only if the note
+    # was saved elsewhere in between.
+    note = get_object_or_404(Note, id=note_id, user=request.user)
+    prepared = None
+    content = _apply_changes(note.content, changes)
+    if note.version == version and content is not None:
+        state = (note.title if title is None else title, content)
+        prepared = revisions.prepare(note.pk, state, (note.title, note.content))
+
+    with transaction.atomic():
+        note = get_object_or_404(Note.objects.select_for_update(), id=note_id, user=request.user)
+        if note.version != version:
+            return JsonResponse(
+                {'version': note.version, 'title': note.title, 'content': note.content},
+                status=409,
+            )
+        previous = (note.title, note.content)
+        content = _apply_changes(note.content, changes)
+        if content is None:
+            return HttpResponseBadRequest('Change out of range.')
+        fields = []
+        if title is not None and title != note.title:
+            note.title = title
+            fields.append('title')
+        if content != note.content:
+            note.content = content
+            fields.append('content')
+        if not fields:
+            return JsonResponse({'version': note.version})
+        note.save(update_fields=[*fields, 'updated_at'])
+        revisions.record(note, previous, prepared)
+    listcache.bump_generation(request.user.pk)
+    return JsonResponse({'version': note.version})
+
+
+MAX_LISTED_REVISIONS = 100
+
+
+@login_required
+def note_revisions(request, note_id):
+    note = get_object_or_404(Note, id=note_id, user=request.user)
+    history = note.revisions.order_by('-id').only(
+        'id', 'note_id', 'title', 'content_length', 'created_at',
+    )[:MAX_LISTED_REVISIONS]
+    return render(request, 'notes/revisions.html', {'note': note, 'revisions': history})
+
+
+@login_required
+def note_revision(request, note_id, revision_id):
+    """Show one saved version of a note; POST restores it."""
+    revision = get_object_or_404(
+        NoteRevision.objects.select_related('note'),
+        id=revision_id, note_id=note_id, note__user=request.user,
+    )
+    if request.method == 'POST':
+        revisions.restore(revision.note, revision)
+        listcache.bump_generation(request.user.pk)
+        messages.success(request, 'Version restored.')
+        return redirect('edit_note', note_id)
+    return render(request, 'notes/revision.html', {
+        'note': revision.note,
+        'revision': revision,
+        'content': revisions.content_of(revision),
+    })
+
+
+@login_required
+@read_from_replica
+@conditional_page(archive_etag)
 def archive_notes(request):
-    notes = Note.objects.filter(
-        user=request.user,
-        archived=True,
-        trashed=False
-    ).order_by('-updated_at')
-    return render(request, 'notes/list.html', {'notes': notes})
+    notes = Note.objects.archived(request.user).only(*LISTING_FIELDS)
+    return _render_listing(request, notes, 'notes/list.html', 'notes/_note_cards.html', {
+        'bulk_actions': [('unarchive', 'Unarchive'), ('trash', 'Delete')],
+    })
 
 
 @login_required
+@read_from_replica
+@conditional_page(trash_etag)
 def trash_notes(request):
-    notes = Note.objects.filter(
-        user=request.user,
-        trashed=True
-    ).order_by('-updated_at')
-    return render(request, 'notes/trash.html', {'notes': notes})
+    notes = Note.objects.in_trash(request.user).only(*LISTING_FIELDS)
+    return _render_listing(request, notes, 'notes/trash.html', 'notes/_trash_cards.html', {
+        'bulk_actions': [('restore', 'Restore'), ('delete', 'Delete forever')],
+        'retention_days': settings.TRASH_RETENTION_DAYS,
+    })
+
+
+def _own_note(request, note_id):
+    return Note.objects.filter(id=note_id, user=request.user)
+
+
+def _changed_or_404(count):
+    if not count:
+        raise Http404('No Note matches the given query.')
 
 
 @login_required
 def archive_note(request, note_id):
-    note = get_object_or_404(Note, id=note_id, user=request.user)
-    note.archived = True
-    note.save()
+    _changed_or_404(_own_note(request, note_id).archive())
+    listcache.bump_generation(request.user.pk)
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
 @login_required
 def unarchive_note(request, note_id):
-    note = get_object_or_404(Note, id=note_id, user=request.user)
-    note.archived = False
-    note.save()
+    _changed_or_404(_own_note(request, note_id).unarchive())
+    listcache.bump_generation(request.user.pk)
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
 @login_required
 def trash_note(request, note_id):
-    note = get_object_or_404(Note, id=note_id, user=request.user)
-    note.trashed = True
-    note.archived = False
-    note.save()
+    _changed_or_404(_own_note(request, note_id).trash())
+    listcache.bump_generation(request.user.pk)
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
 @login_required
 def restore_note(request, note_id):
-    note = get_object_or_404(Note, id=note_id, user=request.user)
-    note.trashed = False
-    note.save()
+    _changed_or_404(_own_note(request, note_id).restore())
+    listcache.bump_generation(request.user.pk)
     return redirect('/trash/')
 
 
 @login_required
 def delete_forever(request, note_id):
-    note = get_object_or_404(Note, id=note_id, user=request.user)
-    note.delete()
+    _changed_or_404(_own_note(request, note_id).delete_forever())
+    listcache.bump_generation(request.user.pk)
     return redirect('/trash/')
 
 
+# action -> (notes it applies to, queryset method performing it)
+BULK_ACTIONS = {
+    'archive': ({'archived': False, 'trashed': False}, NoteQuerySet.archive),
+    'unarchive': ({'archived': True, 'trashed': False}, NoteQuerySet.unarchive),
+    'trash': ({'trashed': False}, NoteQuerySet.trash),
+    'restore': ({'trashed': True}, NoteQuerySet.restore),
+    'delete': ({'trashed': True}, NoteQuerySet.delete_forever),
+}
+MAX_BULK_IDS = 1000
+
+
+@login_required
+@require_POST
+def bulk_action(request):
+    """Apply one action to many notes with a single UPDATE or DELETE.
+
+    Takes ``action`` and a list of ``ids``; ids the user does not own, or
+    notes the action does not apply to, are skipped. Answers JSON with
+    the number of notes changed when asked for it, otherwise redirects
+    back with a message.
+    """
+    action = request.POST.get('action')
+    if action not in BULK_ACTIONS:
+        return HttpResponseBadRequest('Unknown action.')
+    try:
+        ids = [int(note_id) for note_id in request.POST.getlist('ids')]
+    except ValueError:
+        return HttpResponseBadRequest('Invalid note id.')
+    if len(ids) > MAX_BULK_IDS:
+        return HttpResponseBadRequest(f'At most {MAX_BULK_IDS} notes at a time.')
+
+    scope, operation = BULK_ACTIONS[action]
+    with transaction.atomic():
+        count = operation(Note.objects.filter(user=request.user, id__in=ids, **scope))
+    if count:
+        listcache.bump_generation(request.user.pk)
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'action': action, 'count': count})
+    messages.success(request, f'{count} note{pluralize(count)} updated.')
+    return redirect(request.META.get('HTTP_REFERER', '/'))
+
+
 @login_required
 def empty_trash(request):
+    """Queue the deletion of every trashed note; it can be tens of
+    thousands of rows. JSON callers get the job to poll."""
     if request.method == 'POST':
-        Note.objects.filter(user=request.user, trashed=True).delete()
-        messages.success(request, 'Trash emptied.')
+        job = jobs.enqueue('empty_trash', user=request.user, user_id=request.user.pk)
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse(_job_json(job), status=202)
+        messages.success(request, 'Emptying trash.')
     return redirect('/trash/')
 
 
+def _job_json(job):
+    return {
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'url': reverse('job_status', args=[job.pk]),
+    }
+
+
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, user=request.user)
+    return JsonResponse(_job_json(job))
+
+
+MAX_SYNC_PAGE_SIZE = 500
+
+
+@login_required
+def sync_notes(request):
+    """Notes changed and deleted since ``cursor``, for offline clients.
+
+    Answers ``{"notes": [...], "deleted": [ids], "cursor": ..., "more":
+    bool}``; ask again with the returned cursor, at once while ``more`` is
+    true, and on the next sync otherwise. Without a cursor every note is
+    sent. See sync.py.
+    """
+    try:
+        limit = int(request.GET.get('limit', sync.PAGE_SIZE))
+        if not 1 <= limit <= MAX_SYNC_PAGE_SIZE:
+            raise ValueError(limit)
+        page = sync.changes(request.user.pk, request.GET.get('cursor'), limit)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor or limit.')
+    return JsonResponse(page, json_dumps_params={'separators': (',', ':')})
+
+
+# format -> (generator, content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': (transfer.export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'markdown': (transfer.export_markdown, 'application/zip', 'zip'),
+}
+
+
+@login_required
+def export_notes(request):
+    """Stream all of the user's notes as NDJSON or a zip of Markdown files."""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unknown format.')
+    export, content_type, extension = EXPORT_FORMATS[export_format]
+    chunks = export(request.user.pk)
+    if isinstance(request, ASGIRequest):
+        chunks = transfer.aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    filename = f'notes-{timezone.localdate():%Y-%m-%d}.{extension}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@require_POST
+def import_notes(request):
+    """Add the notes of an uploaded NDJSON export (``file``) to the user's.
+
+    JSON callers get the count and throughput; others are sent back to
+    the profile page with a message.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return HttpResponseBadRequest('No file uploaded.')
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+    started = time.monotonic()
+    try:
+        count = transfer.import_ndjson(request.user.pk, upload)
+    except transfer.InvalidImport as exc:
+        if wants_json:
+            return JsonResponse({'error': str(exc), 'imported': exc.imported}, status=400)
+        messages.error(request, f'Imported {exc.imported} notes, then stopped. {exc}')
+        return redirect('profile')
+    elapsed = time.monotonic() - started
+
+    if wants_json:
+        return JsonResponse({
+            'imported': count,
+            'seconds': round(elapsed, 3),
+            'notes_per_second': round(count / max(elapsed, 1e-9)),
+        })
+    messages.success(request, f'Imported {count} note{pluralize(count)}.')
+    return redirect('profile')
+
+
 def login_view(request):
     if request.method == 'POST':
         user = authenticate(
@@ -144,20 +482,21 @@ def signup_view(request):
         elif User.objects.filter(username=username).exists():
             error = 'Username already taken.'
         else:
-            user = User.objects.create_user(username=username, password=password)
-            user.first_name = first_name
-            user.last_name = last_name
-            user.save()
-            # create profile
-            Profile.objects.get_or_create(user=user)
-            # auto-login
-            user = authenticate(request, username=username, password=password)
-            if user:
-                login(request, user)
+            # One INSERT with the names set, so the post_save receiver
+            # builds the profile's letter avatar from them; one password
+            # hash, since the user we just made needs no authenticate().
+            try:
+                with transaction.atomic():
+                    user = User.objects.create_user(
+                        username=username, password=password,
+                        first_name=first_name, last_name=last_name,
+                    )
+            except IntegrityError:
+                error = 'Username already taken.'
+            else:
+                login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
                 messages.success(request, 'Account created and signed in.')
                 return redirect('/')
-            else:
-                error = 'Unable to authenticate new user.'
 
     return render(request, 'notes/signup.html', {'error': error})
 
@@ -177,10 +516,15 @@ def profile_view(request):
     if request.method == 'POST':
         form = ProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            form.save()
-            request.user.first_name = request.POST.get('first_name', '').strip()
-            request.user.last_name = request.POST.get('last_name', '').strip()
-            request.user.save()
+            # Write only what changed.
+            if 'profile_picture' in form.changed_data:
+                profile = form.save()
+                schedule_thumbnails(profile)
+            names = [name for name in ('first_name', 'last_name') if name in form.changed_data]
+            if names:
+                for name in names:
+                    setattr(request.user, name, form.cleaned_data[name])
+                request.user.save(update_fields=names)
             messages.success(request, 'Profile updated successfully.')
             return redirect('profile')
     else:
@@ -189,4 +533,19 @@ def profile_view(request):
     return render(request, 'notes/profile.html', {
         'form': form,
         'profile': profile,
-    })
\ No newline at end of file
+    })
+
+
+def cache_metrics(request):
+    """List-cache hit/miss counters in Prometheus text format.
+
+    Open to staff, or to scrapers sending ``Authorization: Bearer
+    <METRICS_TOKEN>`` when that setting is configured.
+    """
+    if not may_read_metrics(request, request.user):
+        return HttpResponseForbidden()
+    lines = []
+    for name, value in listcache.stats().items():
+        lines.append(f'# TYPE notes_list_cache_{name}_total counter')
+        lines.append(f'notes_list_cache_{name}_total {value}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
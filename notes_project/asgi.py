@@ -3,3 +3,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notes_project.settings')
 application = get_asgi_application()
+
+# Start the job threads, which also pick up jobs left by the process this
+# one replaced (see notes/jobs.py).
+from notes import jobs  # noqa: E402
+
+jobs.start()
@@ -1,6 +1,11 @@
 from pathlib import Path
 from decouple import config, Csv
+import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
+import atexit
 import os
+import shutil
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,12 +24,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'notes.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -33,7 +40,7 @@ ROOT_URLCONF = 'notes_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'notes.instrumentation.DjangoTemplates',
         'DIRS': [BASE_DIR/'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -54,13 +61,148 @@ LOGOUT_REDIRECT_URL = '/login/'
 
 WSGI_APPLICATION = 'notes_project.wsgi.application'
 
+# SERVER_MODE picks the interface gunicorn serves (see gunicorn.conf.py):
+# 'wsgi' with sync workers or 'asgi' with uvicorn workers. ASYNC_VIEWS routes
+# the read-only pages to notes/async_views.py and defaults to on under ASGI,
+# where sync views would all be funnelled through one thread.
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=SERVER_MODE == 'asgi', cast=bool)
+
+# DATABASE_URL selects the primary database (SQLite by default). An optional
+# DATABASE_REPLICA_URL adds a read replica that notes/routers.py sends the
+# listing pages to; a user who has just changed something reads from the
+# primary for REPLICA_PIN_SECONDS so they always see their own writes.
+#
+# SQLite is tuned for a multi-process web server: WAL lets readers run
+# while one connection writes, IMMEDIATE transactions take the write lock
+# up front (a deferred transaction that reads and then writes fails with
+# "database is locked" instead of waiting), and writers wait up to
+# SQLITE_TIMEOUT seconds for the lock. Connections are kept open for
+# CONN_MAX_AGE seconds; under ASGI each request runs in its own thread, so
+# persistent connections would only pile up and stay off by default.
+CONN_MAX_AGE = config('CONN_MAX_AGE', default=0 if SERVER_MODE == 'asgi' else 600, cast=int)
+SQLITE_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': config('SQLITE_TIMEOUT', default=20, cast=int),
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=134217728;'
+        'PRAGMA cache_size=-20000;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+
+
+def database(url):
+    db = dj_database_url.parse(url, conn_max_age=CONN_MAX_AGE, conn_health_checks=True)
+    if db['ENGINE'] == 'django.db.backends.sqlite3':
+        db['OPTIONS'] = SQLITE_OPTIONS
+        # A file, not the default in-memory database, so tests see WAL and
+        # locking behave as in production.
+        db['TEST'] = {'NAME': str(Path(db['NAME']).with_name('test_db.sqlite3'))}
+    return db
+
+
 DATABASES = {
+    'default': database(config('DATABASE_URL', default=f'sqlite:///{BASE_DIR / "db.sqlite3"}')),
+}
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = {**database(DATABASE_REPLICA_URL), 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['notes.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# CACHE_BACKEND selects where rendered note lists and other per-user data
+# are cached: 'file' (shared by all workers on one host, stored under
+# CACHE_LOCATION) or 'locmem' (per process). A change only invalidates the
+# list cache of the worker that handled it, so locmem is refused when
+# gunicorn runs more than WEB_CONCURRENCY=1 worker.
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=2, cast=int)
+CACHE_BACKEND = config('CACHE_BACKEND', default='file')
+if CACHE_BACKEND == 'locmem' and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        'CACHE_BACKEND=locmem needs WEB_CONCURRENCY=1; other workers would keep '
+        'serving stale note lists. Use CACHE_BACKEND=file.'
+    )
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'notes',
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION', default='') or str(BASE_DIR / 'cache'),
+        },
+    }[CACHE_BACKEND],
 }
 
+# SESSION_BACKEND picks where sessions live: 'cached_db' (the database,
+# read through the 'sessions' cache so an authenticated request costs no
+# django_session SELECT), 'db' (the database alone) or 'signed_cookies'
+# (in the cookie itself, signed with SECRET_KEY: no storage to read or
+# write, but logging out cannot revoke a copy of the cookie). SESSION_CACHE
+# is 'file' (shared by the workers on one host) or 'locmem' (per process;
+# refused with more than one worker, as a logout would clear the session
+# from one process's memory). Expired rows are deleted by `manage.py purge_sessions`.
+SESSION_BACKEND = config('SESSION_BACKEND', default='cached_db')
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_BACKEND]
+SESSION_CACHE = config('SESSION_CACHE', default='file')
+if SESSION_BACKEND == 'cached_db' and SESSION_CACHE == 'locmem' and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        'SESSION_CACHE=locmem needs WEB_CONCURRENCY=1; other workers would keep '
+        'accepting sessions that were logged out. Use SESSION_CACHE=file.'
+    )
+CACHES['sessions'] = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('SESSION_CACHE_LOCATION', default='') or str(BASE_DIR / 'cache' / 'sessions'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}[SESSION_CACHE]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# TESTING=True (set by `manage.py test`; set it yourself for other runners)
+# keeps both caches in process memory and media in a temporary directory
+# (see MEDIA_ROOT), so a run leaves no files behind and starts with no
+# cached sessions that its rolled-back django_session rows no longer match.
+TESTING = config('TESTING', default=False, cast=bool)
+if TESTING:
+    CACHES = {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+        for alias in CACHES
+    }
+
+# Per-request timing (notes/instrumentation.py): a Server-Timing header with
+# SQL, template and context-processor time, and a JSON warning log for
+# requests slower than SLOW_REQUEST_MS or that run one statement at least
+# REPEATED_QUERY_THRESHOLD times, listing the SLOW_REQUEST_TOP_QUERIES slowest.
+SERVER_TIMING = config('SERVER_TIMING', default=True, cast=bool)
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=500, cast=int)
+SLOW_REQUEST_TOP_QUERIES = config('SLOW_REQUEST_TOP_QUERIES', default=5, cast=int)
+REPEATED_QUERY_THRESHOLD = config('REPEATED_QUERY_THRESHOLD', default=10, cast=int)
+if TESTING:
+    # Keep the warnings out of the test output; tests that check them
+    # capture them with assertLogs.
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'loggers': {'notes.instrumentation': {'level': 'ERROR'}},
+    }
+
+# Bearer token that lets a metrics scraper read /metrics/ without logging in.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -76,6 +218,8 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -88,4 +232,38 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 WHITENOISE_SKIP_COMPRESSION_FILETYPES = ['jpg', 'jpeg', 'png', 'gif', 'webp', 'zip']
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+if TESTING:
+    # Avatars that signups in tests store go to a scratch directory that
+    # is removed when the run ends.
+    MEDIA_ROOT = Path(tempfile.mkdtemp(prefix='notes-test-media-'))
+    atexit.register(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+
+# Let a front proxy send media files: 'x-accel' (nginx, via an internal
+# location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile'.
+# Empty streams them from Django.
+MEDIA_ACCEL = config('MEDIA_ACCEL', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# Trashed notes older than this are deleted by `manage.py purge_trash`.
+TRASH_RETENTION_DAYS = config('TRASH_RETENTION_DAYS', default=7, cast=int)
+
+# On SQLite, note bodies and revision data of at least this many
+# characters are stored zlib-compressed (see notes/compression.py).
+NOTE_COMPRESS_MIN_LENGTH = config('NOTE_COMPRESS_MIN_LENGTH', default=2048, cast=int)
+
+# Note history older than this is dropped by `manage.py prune_revisions`,
+# which also thins out revisions older than a day (see notes/revisions.py).
+REVISION_RETENTION_DAYS = config('REVISION_RETENTION_DAYS', default=90, cast=int)
+
+# Background jobs (notes/jobs.py). JOBS_MODE is 'thread' (run in a pool of
+# JOBS_THREADS threads in each web process), 'worker' (leave them for
+# `manage.py run_jobs`) or 'eager' (run inline after the request commits).
+JOBS_MODE = config('JOBS_MODE', default='thread')
+JOBS_THREADS = config('JOBS_THREADS', default=2, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+# Seconds after which a job still marked running is assumed abandoned.
+JOB_TIMEOUT = config('JOB_TIMEOUT', default=600, cast=int)
+# How often each web process in 'thread' mode looks for jobs it should pick
+# up, such as those queued by a process that has since restarted.
+JOBS_SWEEP_SECONDS = config('JOBS_SWEEP_SECONDS', default=30, cast=int)
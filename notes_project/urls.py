@@ -2,24 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
-from django.views.decorators.cache import cache_page
-import os
+from notes.media import serve_media
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('notes.urls')),
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', serve_media, name='media'),
 ]
 
-# Serve static and media files
+# Serve static files
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-else:
-    # On Render (production), serve media files via view
-    urlpatterns += [
-        path('media/<path:path>', serve, {
-            'document_root': settings.MEDIA_ROOT,
-        }),
-    ]
\ No newline at end of file